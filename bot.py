@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
+import asyncio
+import io
+import json
 import logging
 import os
 import tempfile
-from pathlib import Path
-import sqlite3
-from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import time
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -16,11 +17,23 @@ from telegram.ext import (
 )
 
 try:
-    from config import TELEGRAM_BOT_TOKEN, LIMITES, MENSAGENS, CATEGORIAS_CLINICAS
+    from config import (TELEGRAM_BOT_TOKEN, LIMITES, MENSAGENS, CATEGORIAS_CLINICAS,
+                        CACHE, SIMILARES, PACIENTES, ARQUIVO, LOGS, LOG_LEVEL, ESCALONADOR, RAJADAS,
+                        RELATORIOS, TRANSCRICAO_BACKENDS)
     from database import DatabaseManager
-    from whisper_api import transcrever_audio_groq, validar_audio
-    from processamento import aplicar_pós_processamento
+    from whisper_api import BalanceadorTranscricao, criar_backend, validar_audio
+    from processamento import aplicar_pós_processamento, extrair_comandos_voz, recortar_trecho_comandos
     from classificacao import detectar_tipo_documento, classificar_categoria_clinica
+    from renderizacao import escapar_markdown, dividir_em_blocos
+    from similares import IndiceSimilares
+    from extracao import PARAMETROS_VITAIS, normalizar_medicamento
+    from pacientes import extrair_nome_paciente
+    from tags import TrieTags, normalizar_tag
+    from registro_log import configurar_logs, id_correlacao, etapa
+    from escalonador import EscalonadorTranscricoes
+    from mensagem_status import AtualizadorStatus
+    from rajadas import AgrupadorRajadas
+    from relatorios import PERIODOS, intervalo, formatar_relatorio, grafico_horas_png
 except ImportError as e:
     print(f"Erro: {e}")
     exit(1)
@@ -40,61 +53,53 @@ def usuario_autorizado(user_id: int) -> bool:
 # 🏷️ SISTEMA DE TAGS
 # ============================================
 
-def criar_tabela_tags():
-    """Cria tabela de tags (executar uma vez)"""
-    conn = sqlite3.connect("lince_transcricoes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tags (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            transcricao_id INTEGER,
-            tag TEXT,
-            data_criacao TEXT,
-            FOREIGN KEY (transcricao_id) REFERENCES transcricoes(id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-    print("✅ Tabela de tags criada/verificada")
-
 async def adicionar_tag(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Adiciona tag à última transcrição"""
+    """Adiciona tag a uma transcrição: /tag [ID] nome (padrão: última transcrição)"""
     if not usuario_autorizado(update.effective_user.id):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
         return
 
-    tag = " ".join(context.args).strip()
-    if not tag:
-        await update.message.reply_text("❌ Use: /tag nome_da_tag")
-        return
-
-    conn = sqlite3.connect("lince_transcricoes.db")
-    cursor = conn.cursor()
+    user_id = update.effective_user.id
+    args = list(context.args)
+    tid = int(args.pop(0)) if args and args[0].isdigit() else None
+    tag = normalizar_tag(" ".join(args))
 
-    cursor.execute("""
-        SELECT id
-        FROM transcricoes
-        WHERE telegram_user_id = ?
-        ORDER BY criado_em DESC
-        LIMIT 1
-    """, (update.effective_user.id,))
-    resultado = cursor.fetchone()
+    if tid is None:
+        ultimas_user = db.buscar_ultimas(limite=1, user_id=user_id)
+        if not ultimas_user:
+            await update.message.reply_text("❌ Nenhuma transcrição encontrada.")
+            return
+        tid = ultimas_user[0]["id"]
+    else:
+        registro = db.buscar_por_id(tid)
+        if not registro or registro["telegram_user_id"] != user_id:
+            await update.message.reply_text("❌ Transcrição não encontrada.")
+            return
 
-    if not resultado:
-        await update.message.reply_text("❌ Nenhuma transcrição encontrada.")
-        conn.close()
+    # Prefixo novo com tags existentes parecidas: sugere antes de criar
+    sugestoes = [] if trie_tags.existe(user_id, tag) else [
+        (sugerida, total) for sugerida, total in trie_tags.sugerir(user_id, tag)
+        if len(f"tagadd_{tid}_{sugerida}".encode("utf-8")) <= 64
+    ]
+    if not tag or sugestoes:
+        botoes = [[InlineKeyboardButton(f"🏷️ {sugerida} ({total})", callback_data=f"tagadd_{tid}_{sugerida}")]
+                  for sugerida, total in (sugestoes or trie_tags.sugerir(user_id, ""))]
+        if tag and len(f"tagadd_{tid}_{tag}".encode("utf-8")) <= 64:
+            botoes.append([InlineKeyboardButton(f"➕ Criar '{tag}'", callback_data=f"tagadd_{tid}_{tag}")])
+        if not botoes:
+            await update.message.reply_text("❌ Use: /tag [ID] nome_da_tag")
+            return
+        await update.message.reply_text(f"🏷️ Tag para o ID {tid}:", reply_markup=InlineKeyboardMarkup(botoes))
         return
 
-    tid = resultado[0]
+    await update.message.reply_text(aplicar_tag(user_id, tid, tag))
 
-    cursor.execute("""
-        INSERT INTO tags (transcricao_id, tag, data_criacao)
-        VALUES (?, ?, ?)
-    """, (tid, tag, datetime.now().isoformat()))
-
-    conn.commit()
-    conn.close()
-    await update.message.reply_text(f"✅ Tag '{tag}' adicionada à última transcrição!")
+def aplicar_tag(user_id: int, tid: int, tag: str) -> str:
+    """Grava a tag, atualiza a trie de sugestões e retorna a resposta ao usuário"""
+    if db.adicionar_tag(tid, tag):
+        trie_tags.adicionar(user_id, tag)
+        return f"✅ Tag '{tag}' adicionada ao ID {tid}!"
+    return f"ℹ️ O ID {tid} já tem a tag '{tag}'."
 
 async def listar_por_tag(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Lista todas as transcrições com uma tag específica"""
@@ -102,47 +107,37 @@ async def listar_por_tag(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
         return
 
-    tag = " ".join(context.args).strip()
+    tag = normalizar_tag(" ".join(context.args))
     if not tag:
         await update.message.reply_text("❌ Use: /listar nome_da_tag")
         return
 
-    conn = sqlite3.connect("lince_transcricoes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT t.id, t.transcricao_formatada, t.criado_em
-        FROM transcricoes t
-        INNER JOIN tags tg ON t.id = tg.transcricao_id
-        WHERE tg.tag = ? AND t.telegram_user_id = ?
-        ORDER BY t.criado_em DESC
-    """, (tag, update.effective_user.id))
-    resultados = cursor.fetchall()
-    conn.close()
+    await responder_por_tag(update.message, update.effective_user.id, tag)
+
+async def responder_por_tag(mensagem, user_id: int, tag: str, pagina: int = 0):
+    """Envia uma página das transcrições com a tag"""
+    por_pagina = LIMITES["itens_por_pagina"]
+    # Um a mais para saber se existe a próxima página
+    resultados = db.buscar_por_tag(user_id, tag, limite=por_pagina + 1, offset=pagina * por_pagina)
 
     if not resultados:
-        await update.message.reply_text(f"❌ Nenhum registro com tag '{tag}'.")
+        await mensagem.reply_text(f"❌ Nenhum registro com tag '{tag}'.")
         return
 
-    resposta = f"📋 *Transcrições com tag '{tag}':*\n\n"
+    resposta = f"📋 *Transcrições com tag* `{tag}`"
+    resposta += f" — página {pagina + 1}:\n\n" if pagina else ":\n\n"
     botoes = []
 
-    for i, (tid, texto, data) in enumerate(resultados, start=1):
-        preview = (
-            texto[:75]
-            .replace("\n", " ")
-            .replace("*", "")
-            .replace("_", "")
-            .replace("[", "")
-            .replace("]", "")
-            .strip()
-            + "..."
-        )
+    for i, (tid, preview, data) in enumerate(resultados[:por_pagina], start=pagina * por_pagina + 1):
         resposta += f"*{i}. ID {tid}* | {data}\n{preview}\n\n"
         botoes.append([InlineKeyboardButton(f"📍 Ver transcrição {i}", callback_data=f"view_{tid}")])
 
+    proxima = f"tagp_{pagina + 1}_{tag}"
+    if len(resultados) > por_pagina and len(proxima.encode("utf-8")) <= 64:
+        botoes.append([InlineKeyboardButton(f"▶️ Mais ({pagina + 2})", callback_data=proxima)])
     botoes.append([InlineKeyboardButton("◀️ Fechar", callback_data="voltar")])
 
-    await update.message.reply_text(
+    await mensagem.reply_text(
         resposta,
         parse_mode="Markdown",
         reply_markup=InlineKeyboardMarkup(botoes)
@@ -154,24 +149,18 @@ async def listar_todas_tags(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
         return
 
-    conn = sqlite3.connect("lince_transcricoes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT tag, COUNT(*)
-        FROM tags
-        GROUP BY tag
-        ORDER BY COUNT(*) DESC
-    """)
-    dados = cursor.fetchall()
-    conn.close()
+    maximo = LIMITES["max_tags_listadas"]
+    dados = db.contagens_tags(update.effective_user.id, limite=maximo + 1)
 
     if not dados:
         await update.message.reply_text("❌ Nenhuma tag cadastrada.")
         return
 
     texto = "🏷️ *Tags disponíveis:*\n\n"
-    for tag, qtd in dados:
+    for _, tag, qtd in dados[:maximo]:
         texto += f"• `{tag}` ({qtd})\n"
+    if len(dados) > maximo:
+        texto += f"\n_Mostrando as {maximo} mais usadas._\n"
 
     await update.message.reply_text(texto, parse_mode="Markdown")
 
@@ -179,12 +168,7 @@ async def listar_todas_tags(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # LOG & DATABASE
 # ============================================
 
-Path("logs").mkdir(exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.FileHandler("logs/lince_bot.log"), logging.StreamHandler()],
-)
+configurar_logs(LOGS["arquivo"], LOG_LEVEL, LOGS["max_bytes"], LOGS["backups"], LOGS["amostragem"])
 logger = logging.getLogger(__name__)
 
 try:
@@ -193,6 +177,14 @@ except Exception as e:
     logger.error(f"Erro ao iniciar BD: {e}")
     exit(1)
 
+indice_similares = IndiceSimilares(SIMILARES["diretorio"], SIMILARES["dimensao"], SIMILARES["cauda_maxima"])
+trie_tags = TrieTags()
+escalonador = EscalonadorTranscricoes(
+    ESCALONADOR["max_concorrentes"], ESCALONADOR["envelhecimento"], ESCALONADOR["segundos_por_segundo"]
+)
+balanceador = BalanceadorTranscricao([criar_backend(c) for c in TRANSCRICAO_BACKENDS])
+rajadas = AgrupadorRajadas(RAJADAS["janela_segundos"], RAJADAS["max_partes"])
+
 # ============================================
 # FUNÇÕES DO BOT
 # ============================================
@@ -209,12 +201,53 @@ async def ajuda(update: Update, context):
         return
     await update.message.reply_text(MENSAGENS["ajuda"], parse_mode="Markdown")
 
+# Resultado de transcrever_parte para download inválido (vazio ou acima do limite)
+ARQUIVO_INVALIDO = object()
+
+async def transcrever_parte(context, user_id: int, audio_obj, extensao: str, status):
+    """
+    Baixa e transcreve um áudio com vaga do escalonador: (texto, backend),
+    ARQUIVO_INVALIDO se o download não passar na validação ou None se vazio
+    """
+    audio_path = None
+
+    async def avisar_fila(posicao, eta):
+        status.definir(f"⏳ Na fila: posição {posicao} (~{eta:.0f}s)")
+
+    try:
+        # Download e transcrição (a parte cara) só com vaga do escalonador
+        async with escalonador.vaga(user_id, audio_obj.duration, audio_obj.file_size, avisar_fila):
+            with etapa(logger, "download"):
+                arquivo = await context.bot.get_file(audio_obj.file_id)
+
+                with tempfile.NamedTemporaryFile(suffix=extensao, delete=False) as tmp:
+                    audio_path = tmp.name
+                await arquivo.download_to_drive(audio_path)
+
+            if not validar_audio(audio_path, LIMITES["max_tamanho_arquivo"]):
+                logger.warning("⚠️ Arquivo inválido (%s)", audio_obj.file_id)
+                return ARQUIVO_INVALIDO
+
+            status.definir("Transcrevendo...")
+            with etapa(logger, "transcricao"):
+                texto_raw, backend = await asyncio.to_thread(balanceador.transcrever, audio_path)
+
+        if not texto_raw or len(texto_raw.strip()) < 10:
+            return None
+        return texto_raw.strip(), backend
+    finally:
+        if audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+
 async def processar_audio(update: Update, context):
     if not usuario_autorizado(update.effective_user.id):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
         return
 
-    audio_path = None
+    status = None
+    user_id = update.effective_user.id
+    token_correlacao = id_correlacao.set(f"{user_id}-{update.message.message_id}")
+    inicio = time.perf_counter()
     try:
         if update.message.voice:
             audio_obj = update.message.voice
@@ -226,47 +259,89 @@ async def processar_audio(update: Update, context):
             await update.message.reply_text("Envie um áudio.")
             return
 
-        file_id = audio_obj.file_id
-        duration = audio_obj.duration
-
-        if duration > LIMITES["max_duracao_audio"]:
+        if audio_obj.duration > LIMITES["max_duracao_audio"]:
             await update.message.reply_text("⛔ Áudio muito longo.")
             return
 
-        msg = await update.message.reply_text("Baixando áudio...")
-        arquivo = await context.bot.get_file(file_id)
+        # Áudios em sequência do mesmo usuário viram um só documento; cada parte
+        # começa a transcrever assim que chega
+        parte = {"mensagem": update.message, "audio": audio_obj}
+        rajada, primeira = rajadas.adicionar(user_id, parte, AtualizadorStatus(update.message))
+        status = rajada.status
+        parte["tarefa"] = context.application.create_task(
+            transcrever_parte(context, user_id, audio_obj, extensao, status)
+        )
 
-        with tempfile.NamedTemporaryFile(suffix=extensao, delete=False) as tmp:
-            audio_path = tmp.name
-        await arquivo.download_to_drive(audio_path)
+        if not primeira:
+            # Quem fecha a rajada e responde é o handler do primeiro áudio
+            status.definir(f"🎙️ {len(rajada.partes)} áudios em sequência, aguardando...")
+            status = None
+            return
 
-        if not validar_audio(audio_path, LIMITES["max_tamanho_arquivo"]):
-            await msg.edit_text("Arquivo inválido")
-            os.remove(audio_path)
+        # Status enviado em background: a resposta inicial corre junto com get_file/download
+        status.definir("Baixando áudio...")
+        partes = await rajadas.aguardar_fechamento(user_id, rajada)
+        textos = await asyncio.gather(*(p["tarefa"] for p in partes), return_exceptions=True)
+
+        validas = []
+        falhas = invalidas = 0
+        for p, resultado in sorted(zip(partes, textos), key=lambda pt: pt[0]["mensagem"].message_id):
+            if isinstance(resultado, Exception):
+                falhas += 1
+                logger.error(f"Erro transcrevendo parte {p['mensagem'].message_id}: {resultado}")
+            elif resultado is ARQUIVO_INVALIDO:
+                invalidas += 1
+            elif resultado:
+                validas.append((p, resultado))
+
+        if not validas:
+            # Falha de rede/backends ou download inválido não é "áudio vazio"
+            if falhas == len(partes):
+                await status.finalizar("Erro ao processar o áudio.")
+            elif invalidas:
+                await status.finalizar("Arquivo inválido")
+            else:
+                await status.finalizar("Transcrição vazia")
             return
 
-        await msg.edit_text("Transcrevendo...")
-        texto_raw = transcrever_audio_groq(audio_path)
+        texto_raw = "\n\n".join(texto for _, (texto, _) in validas)
+        backends = ",".join(dict.fromkeys(backend for _, (_, backend) in validas))
+        duration = sum(p["audio"].duration or 0 for p, _ in validas)
+        mensagens = [(p["mensagem"].message_id, p["audio"].file_id) for p, _ in validas]
+
+        with etapa(logger, "pos_processamento"):
+            texto_limpo, comandos = extrair_comandos_voz(texto_raw)
+            # Recorte "iniciar/parar" antes de salvar: índices e classificação já usam o trecho
+            if {c["tipo"] for c in comandos} & {"iniciar", "parar"}:
+                texto_limpo = recortar_trecho_comandos(texto_raw, comandos) or texto_limpo
+            texto_fmt = aplicar_pós_processamento(texto_limpo)
+        with etapa(logger, "classificacao"):
+            tipo_doc = detectar_tipo_documento(texto_fmt)
+            categorias = classificar_categoria_clinica(texto_fmt)
+            paciente_nome = extrair_nome_paciente(texto_fmt) if PACIENTES["extrair_do_audio"] else None
+
+        with etapa(logger, "banco"):
+            tid = db.salvar_transcricao(
+                mensagens[0][0],
+                user_id,
+                mensagens[0][1],
+                duration,
+                texto_raw,
+                texto_fmt,
+                tipo_doc,
+                categorias,
+                paciente_nome,
+                mensagens,
+                backends
+            )
 
-        if not texto_raw or len(texto_raw.strip()) < 10:
-            await msg.edit_text("Transcrição vazia")
-            os.remove(audio_path)
-            return
+        with etapa(logger, "indice_similares"):
+            indice_similares.adicionar(tid, user_id, texto_fmt)
 
-        texto_fmt = aplicar_pós_processamento(texto_raw)
-        tipo_doc = detectar_tipo_documento(texto_fmt)
-        categorias = classificar_categoria_clinica(texto_fmt)
-
-        tid = db.salvar_transcricao(
-            update.message.message_id,
-            update.message.from_user.id,
-            file_id,
-            duration,
-            texto_raw,
-            texto_fmt,
-            tipo_doc,
-            categorias
-        )
+        if comandos:
+            context.application.create_task(
+                executar_comandos_voz(tid, user_id, comandos)
+            )
 
         botoes = []
 
@@ -281,31 +356,66 @@ async def processar_audio(update: Update, context):
         if cat_line:
             botoes.append(cat_line)
 
-        botoes.append([InlineKeyboardButton("📄 Ver texto completo", callback_data=f"view_{tid}")])
-
-        await msg.delete()
-
+        botoes.append([
+            InlineKeyboardButton("📄 Ver texto completo", callback_data=f"view_{tid}"),
+            InlineKeyboardButton("🔎 Similares", callback_data=f"sim_{tid}"),
+        ])
+
+        aviso_dup = ""
+        duplicata = db.buscar_quase_duplicata(tid)
+        if duplicata:
+            anterior, similaridade = duplicata
+            aviso_dup = f"\n\n⚠️ Parece nova versão do ID `{anterior}` ({similaridade:.0%} similar)"
+            botoes.append([
+                InlineKeyboardButton(f"♻️ Substituir ID {anterior}", callback_data=f"dup_subst_{tid}_{anterior}"),
+                InlineKeyboardButton("🔗 Vincular", callback_data=f"dup_vinc_{tid}_{anterior}"),
+                InlineKeyboardButton("➕ Manter ambas", callback_data=f"dup_manter_{tid}_{anterior}"),
+            ])
+
+        linha_partes = f"🎙️ {len(mensagens)} áudios unidos\n" if len(mensagens) > 1 else ""
         prev = (texto_fmt[:250] + "...") if len(texto_fmt) > 250 else texto_fmt
-        await update.message.reply_text(
-            f"✅ *Transcrição concluída*\n\n🆔 ID `{tid}`\n📋 Tipo: `{tipo_doc}`\n\n{prev}",
+        prev = escapar_markdown(prev)
+        await status.finalizar(
+            f"✅ *Transcrição concluída*\n\n🆔 ID `{tid}`\n📋 Tipo: `{tipo_doc}`\n{linha_partes}\n{prev}{aviso_dup}",
             parse_mode="Markdown",
             reply_markup=InlineKeyboardMarkup(botoes)
         )
 
-        os.remove(audio_path)
+        duracao = (time.perf_counter() - inicio) * 1000
+        logger.info("✅ Áudio processado (ID %s, %d partes, %ss de áudio) em %.0f ms",
+                    tid, len(mensagens), duration, duracao,
+                    extra={"etapa": "total", "duracao_ms": round(duracao, 1), "sempre": True})
 
     except Exception as e:
-        logger.error(f"Erro processando áudio: {e}")
-        await update.message.reply_text("Erro ao processar o áudio.")
-        if audio_path and os.path.exists(audio_path):
-            os.remove(audio_path)
+        logger.exception(f"Erro processando áudio: {e}")
+        if status:
+            await status.finalizar("Erro ao processar o áudio.")
+        else:
+            await update.message.reply_text("Erro ao processar o áudio.")
+    finally:
+        id_correlacao.reset(token_correlacao)
+
+async def executar_comandos_voz(tid: int, user_id: int, comandos: list):
+    """Executa em segundo plano as ações dos comandos de voz de uma transcrição salva
+    (o recorte "iniciar/parar" já foi aplicado antes de salvar)"""
+    tipos = {c["tipo"] for c in comandos}
+    try:
+        if "marcar" in tipos:
+            aplicar_tag(user_id, tid, "importante")
+
+        if "enviar_hf" in tipos:
+            db.enfileirar_exportacao(tid, "HF")
+
+        logger.info(f"🎙️ Comandos de voz executados (ID {tid}): {', '.join(sorted(tipos))}")
+    except Exception as e:
+        logger.error(f"Erro executando comandos de voz (ID {tid}): {e}")
 
 async def ultimas(update: Update, context):
     if not usuario_autorizado(update.effective_user.id):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
         return
 
-    resultados = db.buscar_ultimas(limite=5)
+    resultados = db.buscar_ultimas(limite=5, user_id=update.effective_user.id)
     if not resultados:
         await update.message.reply_text("Nenhuma transcrição")
         return
@@ -314,6 +424,217 @@ async def ultimas(update: Update, context):
         msg += f"ID {r['id']} | {r['tipo_documento']}\n"
     await update.message.reply_text(msg)
 
+async def responder_similares(mensagem, user_id: int, tid: int):
+    """Lista os casos mais parecidos com a transcrição (top-k por cosseno TF-IDF)"""
+    registro = db.buscar_por_id(tid)
+    if not registro or registro["telegram_user_id"] != user_id:
+        await mensagem.reply_text("❌ Transcrição não encontrada.")
+        return
+
+    # Folga para descartar IDs que já saíram do banco (ex.: substituídos)
+    k = SIMILARES["top_k"]
+    candidatos = await asyncio.to_thread(
+        indice_similares.vizinhos, registro["transcricao_formatada"], user_id, k=k * 2, excluir_id=tid
+    )
+    vizinhos = []
+    for vid, score in candidatos:
+        vizinho = db.buscar_por_id(vid)
+        if vizinho:
+            vizinhos.append((vizinho, score))
+        if len(vizinhos) == k:
+            break
+
+    if not vizinhos:
+        await mensagem.reply_text("❌ Nenhum caso similar encontrado.")
+        return
+
+    texto_msg = f"🔎 *Casos similares ao ID {tid}:*\n\n"
+    botoes = []
+    for i, (vizinho, score) in enumerate(vizinhos, start=1):
+        texto_msg += (
+            f"*{i}. ID {vizinho['id']}* | {escapar_markdown(vizinho['tipo_documento'])} | {score:.0%}\n"
+            f"{vizinho['preview_telegram']}\n\n"
+        )
+        botoes.append([InlineKeyboardButton(f"📍 Ver transcrição {i}", callback_data=f"view_{vizinho['id']}")])
+
+    botoes.append([InlineKeyboardButton("◀️ Fechar", callback_data="voltar")])
+    await mensagem.reply_text(texto_msg, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(botoes))
+
+async def similares(update: Update, context):
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("❌ Use: /similares ID")
+        return
+
+    await responder_similares(update.message, update.effective_user.id, int(context.args[0]))
+
+async def responder_lista_parametros(mensagem, titulo: str, linhas: list):
+    """Lista resultados de busca estruturada com botões para ver cada transcrição"""
+    texto_msg = f"🩺 *{titulo}*\n\n"
+    botoes = []
+    for i, (tid, descricao, data) in enumerate(linhas, start=1):
+        texto_msg += f"*{i}. ID {tid}* | {escapar_markdown(descricao)}\n📅 {data}\n\n"
+        botoes.append([InlineKeyboardButton(f"📍 Ver transcrição {i}", callback_data=f"view_{tid}")])
+
+    botoes.append([InlineKeyboardButton("◀️ Fechar", callback_data="voltar")])
+    await mensagem.reply_text(texto_msg, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(botoes))
+
+async def parametro(update: Update, context):
+    """Busca por faixa de sinal vital: /parametro FC 160 [220]"""
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    uso = f"❌ Use: /parametro NOME MIN [MAX]\nNomes: {', '.join(PARAMETROS_VITAIS)}"
+    if len(context.args) not in (2, 3) or context.args[0].upper() not in PARAMETROS_VITAIS:
+        await update.message.reply_text(uso)
+        return
+
+    try:
+        faixa = [float(v.replace(",", ".")) for v in context.args[1:]]
+    except ValueError:
+        await update.message.reply_text(uso)
+        return
+
+    nome = context.args[0].upper()
+    resultados = db.buscar_por_parametro(update.effective_user.id, nome, *faixa)
+    if not resultados:
+        await update.message.reply_text(f"❌ Nenhum registro de {nome} nessa faixa.")
+        return
+
+    faixa_txt = f"{faixa[0]:g}–{faixa[1]:g}" if len(faixa) == 2 else f"≥ {faixa[0]:g}"
+    await responder_lista_parametros(
+        update.message,
+        f"{nome} {faixa_txt}:",
+        [(tid, f"{valor:g} {unidade} ({trecho})", data) for tid, valor, unidade, trecho, data in resultados]
+    )
+
+async def dose(update: Update, context):
+    """Doses registradas de um medicamento: /dose soro antiescorpiônico"""
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    medicamento = normalizar_medicamento(" ".join(context.args))
+    if not medicamento:
+        await update.message.reply_text("❌ Use: /dose nome_do_medicamento")
+        return
+
+    resultados = db.buscar_doses(update.effective_user.id, medicamento)
+    if not resultados:
+        await update.message.reply_text(f"❌ Nenhuma dose de '{medicamento}' registrada.")
+        return
+
+    await responder_lista_parametros(
+        update.message,
+        f"Doses de {medicamento}:",
+        [(tid, f"{med} {valor:g} {unidade}", data) for tid, valor, unidade, med, data in resultados]
+    )
+
+async def definir_paciente(update: Update, context):
+    """Associa paciente a uma transcrição: /definir_paciente [ID] Nome"""
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    args = list(context.args)
+    tid = int(args.pop(0)) if args and args[0].isdigit() else None
+    nome = " ".join(args).strip()
+    if not nome:
+        await update.message.reply_text("❌ Use: /definir_paciente [ID] Nome do paciente")
+        return
+
+    if tid is None:
+        ultimas_user = db.buscar_ultimas(limite=1, user_id=update.effective_user.id)
+        if not ultimas_user:
+            await update.message.reply_text("❌ Nenhuma transcrição encontrada.")
+            return
+        tid = ultimas_user[0]["id"]
+
+    if not db.definir_paciente(tid, update.effective_user.id, nome):
+        await update.message.reply_text("❌ Transcrição não encontrada.")
+        return
+
+    await update.message.reply_text(f"✅ Paciente '{nome}' associado ao ID {tid}.")
+
+async def responder_linha_do_tempo(mensagem, user_id: int, paciente_id: int, pagina: int = 0):
+    """Envia a linha do tempo (transcrições em ordem cronológica) de um paciente, uma página por mensagem"""
+    por_pagina = LIMITES["itens_por_pagina"]
+    nome = db.nome_paciente(paciente_id, user_id)
+    total, registros = db.linha_do_tempo_paciente(
+        paciente_id, user_id, limite=por_pagina, offset=pagina * por_pagina
+    ) if nome else (0, [])
+    if not registros:
+        await mensagem.reply_text("❌ Nenhuma transcrição para este paciente.")
+        return
+
+    texto_msg = f"🧒 *{escapar_markdown(nome)}* — {total} transcrições"
+    texto_msg += f" — página {pagina + 1}\n\n" if pagina else "\n\n"
+    botoes = []
+    for i, (tid, data, tipo, preview) in enumerate(registros, start=pagina * por_pagina + 1):
+        texto_msg += f"*{i}. ID {tid}* | {escapar_markdown(tipo)}\n📅 {data}\n{preview}\n\n"
+        botoes.append([InlineKeyboardButton(f"📍 Ver transcrição {i}", callback_data=f"view_{tid}")])
+
+    if (pagina + 1) * por_pagina < total:
+        botoes.append([InlineKeyboardButton(
+            f"▶️ Mais ({pagina + 2})", callback_data=f"pac_{paciente_id}_{pagina + 1}"
+        )])
+    botoes.append([InlineKeyboardButton("◀️ Fechar", callback_data="voltar")])
+    await mensagem.reply_text(texto_msg, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(botoes))
+
+async def paciente(update: Update, context):
+    """Busca aproximada de paciente: /paciente joao silva"""
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    consulta = " ".join(context.args).strip()
+    if not consulta:
+        await update.message.reply_text("❌ Use: /paciente nome")
+        return
+
+    encontrados = db.buscar_pacientes(
+        update.effective_user.id, consulta, minimo=PACIENTES["similaridade_minima"]
+    )
+    if not encontrados:
+        await update.message.reply_text(f"❌ Nenhum paciente parecido com '{consulta}'.")
+        return
+
+    # Um resultado claramente melhor vai direto para a linha do tempo
+    melhor = encontrados[0]
+    if len(encontrados) == 1 or melhor[2] - encontrados[1][2] >= 0.2:
+        await responder_linha_do_tempo(update.message, update.effective_user.id, melhor[0])
+        return
+
+    botoes = [[InlineKeyboardButton(f"🧒 {nome} ({sim:.0%})", callback_data=f"pac_{pid}")]
+              for pid, nome, sim in encontrados]
+    await update.message.reply_text("🔎 Qual paciente?", reply_markup=InlineKeyboardMarkup(botoes))
+
+async def metricas(update: Update, context):
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    m = db.cache.metricas()
+    f = escalonador.metricas()
+    msg = (
+        "📊 Métricas\n\n"
+        f"💾 Cache: {m['itens']} itens | {m['bytes'] / 1024:.0f}/{m['max_bytes'] / 1024:.0f} KB\n"
+        f"🎯 Acertos: {m['hits']} | Falhas: {m['misses']} | Taxa: {m['taxa_acerto']:.0%}\n"
+        f"♻️ Descartes (LRU): {m['evictions']}\n"
+        f"🚦 Fila: {f['na_fila']} aguardando | {f['executando']} transcrevendo | "
+        f"{f['segundos_por_segundo']:.2f} s por s de áudio\n\n"
+        "🎧 Backends:\n"
+    )
+    for b in balanceador.metricas():
+        latencia = f"{b['latencia']:.1f}s" if b["latencia"] is not None else "—"
+        msg += (f"{'🟢' if b['disponivel'] else '🔴'} {b['nome']}: {latencia} | "
+                f"erros {b['taxa_erro']:.0%} | quota {b['quota']:.0%} | {b['chamadas']} chamadas\n")
+    await update.message.reply_text(msg)
+
 async def categorias_cmd(update: Update, context):
     if not usuario_autorizado(update.effective_user.id):
         await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
@@ -322,78 +643,239 @@ async def categorias_cmd(update: Update, context):
     msg = "Categorias:\n" + "\n".join([f"• {c}" for c in CATEGORIAS_CLINICAS.keys()])
     await update.message.reply_text(msg)
 
-async def listar_por_categoria(update: Update, context, categoria: str):
-    """Lista todas as transcrições de uma categoria específica"""
+async def listar_por_categoria(update: Update, context, categoria: str, pagina: int = 0):
+    """Lista as transcrições de uma categoria, uma página por mensagem"""
     query = update.callback_query
 
     if not usuario_autorizado(query.from_user.id):
         await query.answer("⛔ Acesso negado", show_alert=True)
         return
 
-    conn = sqlite3.connect("lince_transcricoes.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, tipo_documento, criado_em, transcricao_formatada, categorias
-        FROM transcricoes
-        WHERE telegram_user_id = ?
-        ORDER BY criado_em DESC
-    """, (query.from_user.id,))
-    todas = cursor.fetchall()
-    conn.close()
-
-    resultados = []
-    for tid, tipo, data, texto, cats in todas:
-        if cats and categoria.lower() in cats.lower():
-            resultados.append((tid, tipo, data, texto))
+    por_pagina = LIMITES["itens_por_pagina"]
+    # Um a mais para saber se existe a próxima página
+    resultados = [
+        (r["id"], r["tipo_documento"], r["criado_em"], r["preview_telegram"])
+        for r in db.buscar_por_categoria(categoria, limite=por_pagina + 1, offset=pagina * por_pagina,
+                                         user_id=query.from_user.id)
+    ]
 
     if not resultados:
         await query.answer("❌ Nenhum registro nesta categoria.", show_alert=True)
         return
 
-    texto_msg = f"🏷️ *Categoria: {categoria}*\n\n"
+    texto_msg = f"🏷️ *Categoria: {categoria}*"
+    texto_msg += f" — página {pagina + 1}\n\n" if pagina else "\n\n"
     botoes = []
 
-    for i, (tid, tipo, data, texto) in enumerate(resultados, start=1):
-        preview = (
-            texto[:75]
-            .replace("\n", " ")
-            .replace("*", "")
-            .replace("_", "")
-            .replace("[", "")
-            .replace("]", "")
-            .strip()
-            + "..."
-        )
-        texto_msg += f"*{i}. ID {tid}* | {tipo}\n📅 {data}\n{preview}\n\n"
+    for i, (tid, tipo, data, preview) in enumerate(resultados[:por_pagina], start=pagina * por_pagina + 1):
+        texto_msg += f"*{i}. ID {tid}* | {escapar_markdown(tipo)}\n📅 {data}\n{preview}\n\n"
         botoes.append([InlineKeyboardButton(f"📍 Ver transcrição {i}", callback_data=f"view_{tid}")])
 
+    if len(resultados) > por_pagina:
+        botoes.append([InlineKeyboardButton(
+            f"▶️ Mais ({pagina + 2})", callback_data=f"catp_{pagina + 1}_{categoria.replace(' ', '_')}"
+        )])
     botoes.append([InlineKeyboardButton("◀️ Fechar", callback_data="voltar")])
 
     await query.message.reply_text(texto_msg, parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(botoes))
     await query.answer()
 
+async def enviar_transcricao_completa(mensagem, tid: int, registro, pagina: int = 0):
+    """Envia os blocos pré-renderizados, com botão de continuar ou como documento"""
+    if registro["blocos_telegram"]:
+        blocos = json.loads(registro["blocos_telegram"])
+    else:
+        blocos = dividir_em_blocos(registro["transcricao_formatada"])
+
+    if len(blocos) > LIMITES["max_blocos_mensagem"]:
+        arquivo = io.BytesIO(registro["transcricao_formatada"].encode("utf-8"))
+        await mensagem.reply_document(
+            InputFile(arquivo, filename=f"transcricao_{tid}.txt"),
+            caption=f"📄 Transcrição completa (ID {tid}) — {len(blocos)} partes, enviada como arquivo"
+        )
+        return
+
+    pagina = min(pagina, len(blocos) - 1)
+    cabecalho = f"📄 *Transcrição completa (ID {tid})"
+    cabecalho += f" — {pagina + 1}/{len(blocos)}:*" if len(blocos) > 1 else ":*"
+
+    botoes = None
+    if pagina + 1 < len(blocos):
+        botoes = InlineKeyboardMarkup([[InlineKeyboardButton(
+            f"▶️ Continuar ({pagina + 2}/{len(blocos)})", callback_data=f"view_{tid}_{pagina + 1}"
+        )]])
+
+    await mensagem.reply_text(
+        f"{cabecalho}\n\n{blocos[pagina]}",
+        parse_mode="Markdown",
+        reply_markup=botoes
+    )
+
+async def resolver_quase_duplicata(query):
+    """Substitui, vincula ou mantém a versão anterior de uma quase-duplicata"""
+    _, acao, tid, anterior = query.data.split("_")
+    tid, anterior = int(tid), int(anterior)
+
+    nova, antiga = db.buscar_por_id(tid), db.buscar_por_id(anterior)
+    dono = query.from_user.id
+    if not nova or not antiga or {nova["telegram_user_id"], antiga["telegram_user_id"]} != {dono}:
+        await query.message.reply_text("❌ Transcrição não encontrada.")
+        return
+
+    if acao == "subst":
+        removidas = db.substituir_transcricao(tid, anterior)
+        ok = removidas is not None
+        for tag in removidas or []:
+            trie_tags.adicionar(dono, tag, -1)
+        resposta = f"♻️ ID {anterior} substituído pelo ID {tid}."
+    elif acao == "vinc":
+        ok = db.vincular_versao(tid, anterior)
+        resposta = f"🔗 ID {tid} vinculado como nova versão do ID {anterior}."
+    else:
+        ok = db.descartar_quase_duplicata(tid)
+        resposta = f"➕ IDs {anterior} e {tid} mantidos separados."
+
+    if not ok:
+        await query.message.reply_text("❌ Erro ao resolver duplicata.")
+        return
+
+    # Remove a linha de botões de duplicata da mensagem original
+    teclado = [linha for linha in query.message.reply_markup.inline_keyboard
+               if not linha[0].callback_data.startswith("dup_")]
+    await query.message.edit_reply_markup(InlineKeyboardMarkup(teclado))
+    await query.message.reply_text(resposta)
+
 async def button_callback(update: Update, context):
     """Handler de callbacks dos botões"""
     query = update.callback_query
     await query.answer()
 
     if query.data.startswith("view_"):
-        tid = int(query.data.split("_")[1])
+        partes = query.data.split("_")
+        tid = int(partes[1])
+        pagina = int(partes[2]) if len(partes) > 2 else 0
         registro = db.buscar_por_id(tid)
         if registro:
-            texto = registro["transcricao_formatada"]
-            await query.message.reply_text(
-                f"📄 *Transcrição completa (ID {tid}):*\n\n{texto[:4000]}",
-                parse_mode="Markdown"
-            )
+            await enviar_transcricao_completa(query.message, tid, registro, pagina)
 
     elif query.data.startswith("cat_"):
         categoria = query.data.replace("cat_", "").replace("_", " ")
         await listar_por_categoria(update, context, categoria)
 
+    elif query.data.startswith("catp_"):
+        _, pagina, categoria = query.data.split("_", 2)
+        await listar_por_categoria(update, context, categoria.replace("_", " "), int(pagina))
+
+    elif query.data.startswith("sim_"):
+        tid = int(query.data.split("_")[1])
+        await responder_similares(query.message, query.from_user.id, tid)
+
+    elif query.data.startswith("pac_"):
+        partes = query.data.split("_")
+        pagina = int(partes[2]) if len(partes) > 2 else 0
+        await responder_linha_do_tempo(query.message, query.from_user.id, int(partes[1]), pagina)
+
+    elif query.data.startswith("tagp_"):
+        _, pagina, tag = query.data.split("_", 2)
+        await responder_por_tag(query.message, query.from_user.id, tag, int(pagina))
+
+    elif query.data.startswith("tagadd_"):
+        _, tid, tag = query.data.split("_", 2)
+        registro = db.buscar_por_id(int(tid))
+        if registro and registro["telegram_user_id"] == query.from_user.id:
+            await query.message.edit_text(aplicar_tag(query.from_user.id, int(tid), tag))
+
+    elif query.data.startswith("dup_"):
+        await resolver_quase_duplicata(query)
+
     elif query.data == "voltar":
         await query.message.delete()
 
+# ============================================
+# ARQUIVAMENTO
+# ============================================
+
+async def job_arquivar(context: ContextTypes.DEFAULT_TYPE):
+    """Move transcrições antigas para os arquivos mensais, um lote por vez"""
+    total = 0
+    while True:
+        movidas = db.arquivar_lote()
+        total += movidas
+        if movidas < ARQUIVO["lote"]:
+            break
+        # Devolve o loop aos handlers entre lotes
+        await asyncio.sleep(0)
+
+    if total:
+        logger.info(f"📦 Arquivamento concluído: {total} transcrições")
+        # Passos curtos de incremental_vacuum: saves nunca esperam a compactação inteira
+        while db.compactar_passo():
+            await asyncio.sleep(0)
+
+async def job_compactar_similares(context: ContextTypes.DEFAULT_TYPE):
+    """Regrava o segmento por termo do índice de similares quando a cauda cresce"""
+    if indice_similares.precisa_compactar():
+        await asyncio.to_thread(indice_similares.compactar)
+
+# ============================================
+# RELATÓRIOS
+# ============================================
+
+async def gerar_snapshots(periodos=tuple(PERIODOS)):
+    """Atualiza os agregados e regrava o snapshot (texto + gráfico) de cada usuário"""
+    db.atualizar_agregados_relatorio()
+    for user_id in ALLOWED_IDS:
+        for periodo in periodos:
+            dados = db.agregar_relatorio(user_id, *intervalo(periodo))
+            if dados is None:
+                # Mantém o snapshot anterior
+                continue
+            # Gráfico gerado numa thread para não travar o loop
+            grafico = await asyncio.to_thread(grafico_horas_png, dados["horas"]) if dados["total"] else None
+            db.salvar_snapshot_relatorio(user_id, periodo, dados, grafico)
+
+async def job_atualizar_relatorios(context: ContextTypes.DEFAULT_TYPE):
+    await gerar_snapshots()
+
+async def job_enviar_relatorio(context: ContextTypes.DEFAULT_TYPE):
+    """Envia o relatório do período (context.job.data) a cada médico com atividade"""
+    periodo = context.job.data
+    await gerar_snapshots((periodo,))
+    for user_id in ALLOWED_IDS:
+        snapshot = db.buscar_snapshot_relatorio(user_id, periodo)
+        if not snapshot or not snapshot[0]["total"]:
+            continue
+        try:
+            await enviar_relatorio(context.bot, user_id, periodo, snapshot)
+        except Exception as e:
+            logger.error(f"Erro enviando relatório {periodo} para {user_id}: {e}")
+
+async def enviar_relatorio(bot, chat_id: int, periodo: str, snapshot):
+    dados, grafico, _ = snapshot
+    texto = formatar_relatorio(periodo, dados)
+    if grafico:
+        await bot.send_photo(chat_id, InputFile(io.BytesIO(grafico), filename="horarios.png"),
+                             caption=texto, parse_mode="Markdown")
+    else:
+        await bot.send_message(chat_id, texto, parse_mode="Markdown")
+
+async def relatorio(update: Update, context):
+    """/relatorio [semanal|mensal] — responde do último snapshot"""
+    if not usuario_autorizado(update.effective_user.id):
+        await update.message.reply_text("⛔ Acesso negado. Este bot é privado.")
+        return
+
+    periodo = context.args[0].lower() if context.args else "semanal"
+    if periodo not in PERIODOS:
+        await update.message.reply_text("Uso: /relatorio [semanal|mensal]")
+        return
+
+    snapshot = db.buscar_snapshot_relatorio(update.effective_user.id, periodo)
+    if snapshot is None:
+        await update.message.reply_text("⏳ Relatório ainda não gerado, tente em alguns minutos.")
+        return
+    await enviar_relatorio(context.bot, update.effective_chat.id, periodo, snapshot)
+
 # ============================================
 # MAIN
 # ============================================
@@ -403,22 +885,44 @@ def main():
         print("TELEGRAM_BOT_TOKEN não configurado")
         return
 
-    criar_tabela_tags()
     print(f"✅ Bot iniciado com restrição de acesso")
     print(f"✅ IDs autorizados: {ALLOWED_IDS}")
 
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    db.aquecer_cache(ALLOWED_IDS, CACHE["aquecer_ultimas"])
+    trie_tags.carregar(db.contagens_tags())
+
+    if not indice_similares.consistente() or indice_similares.total_documentos() < db.contar_transcricoes():
+        indice_similares.reconstruir(db.iterar_textos())
+
+    # Updates concorrentes: quem decide a ordem das transcrições é o escalonador
+    app = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("ajuda", ajuda))
     app.add_handler(CommandHandler("ultimas", ultimas))
     app.add_handler(CommandHandler("categorias", categorias_cmd))
+    app.add_handler(CommandHandler("metricas", metricas))
+    app.add_handler(CommandHandler("similares", similares))
+    app.add_handler(CommandHandler("parametro", parametro))
+    app.add_handler(CommandHandler("dose", dose))
+    app.add_handler(CommandHandler("definir_paciente", definir_paciente))
+    app.add_handler(CommandHandler("paciente", paciente))
     app.add_handler(CommandHandler("tag", adicionar_tag))
     app.add_handler(CommandHandler("listar", listar_por_tag))
     app.add_handler(CommandHandler("tags", listar_todas_tags))
+    app.add_handler(CommandHandler("relatorio", relatorio))
     app.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, processar_audio))
     app.add_handler(CallbackQueryHandler(button_callback))
 
+    app.job_queue.run_repeating(job_compactar_similares, interval=SIMILARES["compactacao_minutos"] * 60,
+                                first=SIMILARES["compactacao_minutos"] * 60)
+    app.job_queue.run_repeating(job_arquivar, interval=ARQUIVO["intervalo_horas"] * 3600, first=60)
+    app.job_queue.run_repeating(job_atualizar_relatorios, interval=RELATORIOS["atualizacao_minutos"] * 60,
+                                first=30)
+    # days: 0 = domingo no PTB 20; relatório semanal sai na segunda
+    app.job_queue.run_daily(job_enviar_relatorio, RELATORIOS["horario_envio"], days=(1,), data="semanal")
+    app.job_queue.run_monthly(job_enviar_relatorio, RELATORIOS["horario_envio"], day=1, data="mensal")
+
     logger.info("Bot iniciado")
     app.run_polling()
 
@@ -0,0 +1,95 @@
+"""
+Cache LRU em memória para transcrições recentes (limitado por bytes)
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _tamanho_estimado(valor) -> int:
+    """Estimativa barata do tamanho de uma linha (ou lista de linhas) em bytes."""
+    if isinstance(valor, list):
+        return sum(_tamanho_estimado(v) for v in valor) + 64
+    return 200 + sum(len(str(v)) for v in valor.values() if v is not None)
+
+
+class CacheTranscricoes:
+    """
+    LRU único para duas chaves:
+    - ("id", transcricao_id) → linha completa (callbacks view_<id>)
+    - ("ultimas", user_id, limite) → lista de linhas (/ultimas)
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.itens = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def obter(self, chave):
+        """Retorna o valor em cache (ou None) e atualiza a ordem LRU."""
+        with self.lock:
+            item = self.itens.get(chave)
+            if item is None:
+                self.misses += 1
+                return None
+            self.itens.move_to_end(chave)
+            self.hits += 1
+            return item[0]
+
+    def guardar(self, chave, valor):
+        """Guarda valor e remove os menos usados até caber no limite."""
+        tamanho = _tamanho_estimado(valor)
+        if tamanho > self.max_bytes:
+            return
+        with self.lock:
+            antigo = self.itens.pop(chave, None)
+            if antigo:
+                self.bytes -= antigo[1]
+            self.itens[chave] = (valor, tamanho)
+            self.bytes += tamanho
+            while self.bytes > self.max_bytes:
+                _, (_, tam) = self.itens.popitem(last=False)
+                self.bytes -= tam
+                self.evictions += 1
+
+    def _remover(self, chave):
+        item = self.itens.pop(chave, None)
+        if item:
+            self.bytes -= item[1]
+
+    def invalidar(self, transcricao_id=None, user_id=None):
+        """
+        Invalida uma transcrição e as listas de últimas afetadas.
+        Sem user_id, descarta toda lista de últimas que contenha o ID.
+        """
+        with self.lock:
+            if transcricao_id is not None:
+                self._remover(("id", transcricao_id))
+            for chave, (valor, _) in list(self.itens.items()):
+                if chave[0] != "ultimas":
+                    continue
+                if user_id is not None and chave[1] == user_id:
+                    self._remover(chave)
+                elif user_id is None and any(r["id"] == transcricao_id for r in valor):
+                    self._remover(chave)
+
+    def metricas(self) -> dict:
+        """Retorna contadores de uso do cache."""
+        with self.lock:
+            consultas = self.hits + self.misses
+            return {
+                "itens": len(self.itens),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "taxa_acerto": (self.hits / consultas) if consultas else 0.0,
+            }
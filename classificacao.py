@@ -18,23 +18,23 @@ def detectar_tipo_documento(texto: str) -> str:
 
     # Marcadores SOAP
     if any(m in texto_lower for m in ['s:', 'o:', 'a:', 'p:', 'soap', 'subjetivo', 'objetivo', 'avaliação', 'plano']):
-        logger.info("📋 Tipo detectado: SOAP")
+        logger.debug("📋 Tipo detectado: SOAP")
         return "SOAP"
 
     # Marcadores Anamnese
     if any(m in texto_lower for m in ['admitido', 'queixa principal', 'qp:', 'hma', 'hpp', 
                                        'história da moléstia', 'trazido', 'encaminhado', 'medicamentos em uso']):
-        logger.info("📋 Tipo detectado: ANAMNESE")
+        logger.debug("📋 Tipo detectado: ANAMNESE")
         return "ANAMNESE"
 
     # Marcadores Evolução
     if any(m in texto_lower for m in ['evolução', 'dia ', 'hoje ', 'paciente mantém', 
                                        'paciente apresenta', 'paciente evolui']):
-        logger.info("📋 Tipo detectado: EVOLUCAO")
+        logger.debug("📋 Tipo detectado: EVOLUCAO")
         return "EVOLUCAO"
 
     # Padrão: Exame físico isolado
-    logger.info("📋 Tipo detectado: EXAME_FISICO")
+    logger.debug("📋 Tipo detectado: EXAME_FISICO")
     return "EXAME_FISICO"
 
 
@@ -63,7 +63,7 @@ def classificar_categoria_clinica(texto: str) -> list:
     if not categorias:
         categorias = ["GERAL"]
 
-    logger.info(f"🏷️ Categorias detectadas: {', '.join(categorias)}")
+    logger.info("🏷️ Categorias detectadas: %s", categorias)
     return categorias
 
 
@@ -1,4 +1,7 @@
+import datetime
+import json
 import os
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,11 +12,92 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 DATABASE_PATH = os.getenv("DATABASE_PATH", "lince_transcricoes.db")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
+# Backends de transcrição: TRANSCRICAO_BACKENDS (JSON, lista de {"nome", "tipo", ...})
+# ou, por padrão, um backend Groq por chave em GROQ_API_KEY (separadas por vírgula)
+GROQ_URL = "https://api.groq.com/openai/v1/audio/transcriptions"
+if os.getenv("TRANSCRICAO_BACKENDS"):
+    TRANSCRICAO_BACKENDS = json.loads(os.getenv("TRANSCRICAO_BACKENDS"))
+else:
+    TRANSCRICAO_BACKENDS = [
+        {"nome": f"groq-{i}", "tipo": "openai", "url": GROQ_URL, "api_key": chave.strip(),
+         "modelo": "whisper-large-v3"}
+        for i, chave in enumerate((GROQ_API_KEY or "").split(","), start=1) if chave.strip()
+    ]
+
+# Logs: JSON com rotação por tamanho; linhas INFO de 1 a cada N áudios (1 = todos)
+LOGS = {
+    "arquivo": os.path.join("logs", "lince_bot.log"),
+    "max_bytes": 5 * 1024 * 1024,
+    "backups": 5,
+    "amostragem": int(os.getenv("LOG_AMOSTRAGEM", "10"))
+}
+
 # Limites
 LIMITES = {
     "max_duracao_audio": 600,
     "max_tamanho_arquivo": 20 * 1024 * 1024,
-    "timeout_transcricao": 60
+    "timeout_transcricao": 60,
+    "max_blocos_mensagem": 4,
+    "itens_por_pagina": 5,
+    "max_tags_listadas": 50
+}
+
+# Escalonador de transcrições (menor custo primeiro, com envelhecimento e cota por usuário)
+ESCALONADOR = {
+    "max_concorrentes": int(os.getenv("MAX_TRANSCRICOES_SIMULTANEAS", "3")),
+    "envelhecimento": 1.0,        # segundos de prioridade ganhos por segundo de espera
+    "segundos_por_segundo": 0.2   # estimativa inicial de processamento por segundo de áudio
+}
+
+# Rajadas: áudios do mesmo usuário com até JANELA_RAJADA segundos entre si viram um
+# documento. Cada resposta espera a janela fechar, por isso vem desligado (0)
+RAJADAS = {
+    "janela_segundos": float(os.getenv("JANELA_RAJADA", "0")),
+    "max_partes": 6
+}
+
+# Cache em memória de transcrições recentes
+CACHE = {
+    "max_bytes": 8 * 1024 * 1024,
+    "aquecer_ultimas": 20
+}
+
+# Quase-duplicatas (MinHash/LSH)
+DUPLICATAS = {
+    "limiar_similaridade": 0.8
+}
+
+# Índice TF-IDF de casos similares (arquivos NumPy ao lado do banco)
+SIMILARES = {
+    "diretorio": os.path.join(os.path.dirname(DATABASE_PATH) or ".", "indice_similares"),
+    "dimensao": 2 ** 18,
+    "top_k": 5,
+    "cauda_maxima": 200_000,       # entradas fora do segmento por termo antes de recompactar
+    "compactacao_minutos": 30
+}
+
+# Arquivamento: transcrições antigas saem do banco quente para arquivos mensais
+ARQUIVO = {
+    "diretorio": os.path.join(os.path.dirname(DATABASE_PATH) or ".", "arquivo"),
+    "dias_quente": int(os.getenv("ARQUIVO_DIAS", "180")),
+    "lote": 500,
+    "intervalo_horas": 24,
+    "paginas_por_compactacao": 256   # ~1 MB por passo de incremental_vacuum
+}
+
+# Relatórios periódicos (agregados atualizados em background, envio às segundas e no dia 1).
+# Dias, horas do gráfico e horário de envio usam o mesmo fuso, não o do servidor.
+_FUSO_RELATORIOS = ZoneInfo(os.getenv("RELATORIO_FUSO", "America/Sao_Paulo"))
+RELATORIOS = {
+    "atualizacao_minutos": 60,
+    "fuso": _FUSO_RELATORIOS,
+    "horario_envio": datetime.time(hour=int(os.getenv("RELATORIO_HORA", "7")), tzinfo=_FUSO_RELATORIOS)
+}
+
+# Pacientes (extração do nome no ditado é opcional)
+PACIENTES = {
+    "extrair_do_audio": os.getenv("EXTRAIR_PACIENTE", "false").lower() == "true",
+    "similaridade_minima": 0.3
 }
 
 # Mensagens do bot
@@ -29,6 +113,7 @@ MENSAGENS = {
 /ajuda - Instruções
 /categorias - Ver categorias
 /ultimas - Últimas 5 transcrições
+/similares ID - Casos parecidos
 
 ✅ Pronto para começar!""",
 
@@ -42,9 +127,22 @@ MENSAGENS = {
 🏷️ **Categorias Automáticas:**
 ASMA, SEPSE, GASTROENTERITE, PNEUMONIA, CONVULSÃO, DIABETES, DESIDRATAÇÃO, MENINGITE, BRONQUIOLITE, PICADA_ESCORPIÃO, FEBRE_SEM_FOCO, INFECÇÃO_URINÁRIA, OTITE
 
+🎙️ **Comandos de voz (no áudio):**
+"Lince, marcar importante" - adiciona a tag importante
+"Lince, enviar para HF" - coloca na fila de exportação
+"Lince, iniciar/parar transcrição" - salva só o trecho entre os dois
+
 🔍 **Comandos:**
 /categorias - Listar todas
 /ultimas - Últimas 5
+/similares ID - Transcrições mais parecidas com a ID
+/parametro FC 160 \\[220] - Busca por sinal vital (FC, FR, SPO2, TEMP, GLICEMIA, ECG)
+/dose medicamento - Doses registradas
+/definir\\_paciente \\[ID] Nome - Associa paciente (padrão: última transcrição)
+/paciente nome - Linha do tempo do paciente (aceita erros de digitação)
+/tag \\[ID] nome - Adiciona tag (sugere tags existentes pelo prefixo)
+/tags - Tags mais usadas | /listar tag - Transcrições com a tag
+/relatorio \\[semanal|mensal] - Resumo da semana ou do mês anterior
 
 ✅ Envie um áudio para começar!"""
 }
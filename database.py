@@ -5,9 +5,20 @@ Gerenciamento de banco de dados SQLite com indexação
 import sqlite3
 import json
 import logging
-from datetime import datetime, timedelta
+import math
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from config import DATABASE_PATH
+from config import DATABASE_PATH, CACHE, DUPLICATAS, ARQUIVO, RELATORIOS
+from migracoes import aplicar_migracoes
+from cache import CacheTranscricoes
+from renderizacao import renderizar
+import duplicatas
+from extracao import extrair_parametros
+from pacientes import registrar_paciente, trigramas
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +27,13 @@ class DatabaseManager:
     def __init__(self, db_path=DATABASE_PATH):
         self.db_path = db_path
         self.conn = None
+        self.versao_schema = 0
+        self.cache = CacheTranscricoes(CACHE["max_bytes"])
+        inicio = time.perf_counter()
         self.conectar()
         self.criar_tabelas()
+        logger.info(f"⏱️ Banco pronto em {(time.perf_counter() - inicio) * 1000:.1f} ms "
+                    f"(schema v{self.versao_schema})")
 
     def conectar(self):
         """Conecta ao banco de dados."""
@@ -30,181 +46,996 @@ class DatabaseManager:
             raise
 
     def criar_tabelas(self):
-        """Cria tabelas se não existirem."""
-        cursor = self.conn.cursor()
-
-        # Tabela principal
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transcricoes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_message_id INTEGER UNIQUE,
-                telegram_user_id INTEGER,
-                data_hora TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                audio_file_id TEXT,
-                audio_duracao INTEGER,
-                transcricao_raw TEXT,
-                transcricao_formatada TEXT,
-                tipo_documento TEXT,
-                categorias TEXT,
-                paciente_nome TEXT,
-                tags_adicionais TEXT,
-                editado BOOLEAN DEFAULT 0,
-                enviado_hf BOOLEAN DEFAULT 0,
-                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        # Índices para busca rápida
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_categorias ON transcricoes(categorias)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_data ON transcricoes(data_hora)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tipo ON transcricoes(tipo_documento)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user ON transcricoes(telegram_user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_paciente ON transcricoes(paciente_nome)")
-
-        self.conn.commit()
-        logger.info("✅ Tabelas criadas/verificadas")
+        """Cria/atualiza o schema aplicando as migrações pendentes."""
+        self.versao_schema = aplicar_migracoes(self.conn)
+        self._ativar_vacuum_incremental()
 
     def salvar_transcricao(self, message_id, user_id, audio_file_id, duracao,
                           transcricao_raw, transcricao_formatada, tipo, categorias,
-                          paciente_nome=None):
-        """Salva transcrição no banco."""
+                          paciente_nome=None, mensagens_origem=None, backend=None):
+        """
+        Salva transcrição no banco. `mensagens_origem` lista (message_id, file_id)
+        de cada áudio quando vários foram unidos num só documento; `backend` é o
+        nome do(s) backend(s) de transcrição usado(s).
+        """
         try:
+            preview, blocos = renderizar(transcricao_formatada)
             cursor = self.conn.cursor()
+            paciente_id = registrar_paciente(cursor, user_id, paciente_nome) if paciente_nome else None
             cursor.execute("""
                 INSERT INTO transcricoes 
                 (telegram_message_id, telegram_user_id, audio_file_id, audio_duracao,
-                 transcricao_raw, transcricao_formatada, tipo_documento, categorias, paciente_nome)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 transcricao_raw, transcricao_formatada, tipo_documento, categorias, paciente_nome,
+                 paciente_id, preview_telegram, blocos_telegram, backend_transcricao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (message_id, user_id, audio_file_id, duracao, transcricao_raw,
-                  transcricao_formatada, tipo, json.dumps(categorias), paciente_nome))
+                  transcricao_formatada, tipo, json.dumps(categorias), paciente_nome,
+                  paciente_id, preview, blocos, backend))
+            tid = cursor.lastrowid
+            cursor.executemany("""
+                INSERT INTO transcricao_mensagens (transcricao_id, parte, telegram_message_id, audio_file_id)
+                VALUES (?, ?, ?, ?)
+            """, [(tid, parte, mid, fid) for parte, (mid, fid)
+                  in enumerate(mensagens_origem or [(message_id, audio_file_id)])])
+            self._indexar_minhash(cursor, tid, user_id, transcricao_formatada)
+            self._gravar_parametros(cursor, tid, user_id, transcricao_formatada)
             self.conn.commit()
-            logger.info(f"✅ Transcrição salva (ID: {cursor.lastrowid})")
-            return cursor.lastrowid
+            self.cache.invalidar(user_id=user_id)
+            logger.info("✅ Transcrição salva (ID: %s)", tid)
+            return tid
         except Exception as e:
+            self.conn.rollback()
             logger.error(f"❌ Erro ao salvar: {e}")
             raise
 
-    def buscar_por_categoria(self, categoria, limite=10, offset=0):
-        """Busca transcrições por categoria."""
+    def _indexar_minhash(self, cursor, tid, user_id, texto):
+        """
+        Grava assinatura MinHash e buckets LSH da transcrição e registra
+        a quase-duplicata mais parecida do mesmo usuário (se houver).
+        """
+        assinatura = duplicatas.calcular_assinatura(texto)
+        bandas = duplicatas.hashes_bandas(assinatura)
+
+        # Candidatas: quem cai em pelo menos um bucket igual. Uma busca em
+        # idx_lsh_bucket por banda; CROSS JOIN fixa essa ordem (sem ela o
+        # planejador pode partir de todas as transcrições do usuário)
+        sondas = " UNION ".join(
+            ["SELECT transcricao_id FROM lsh_buckets WHERE banda = ? AND hash = ?"] * len(bandas)
+        )
+        params = [v for par in enumerate(bandas) for v in par]
+        cursor.execute(f"""
+            SELECT c.transcricao_id, m.assinatura
+            FROM ({sondas}) c
+            CROSS JOIN minhash_assinaturas m ON m.transcricao_id = c.transcricao_id
+            CROSS JOIN transcricoes t ON t.id = c.transcricao_id
+            WHERE t.telegram_user_id = ?
+        """, (*params, user_id))
+
+        melhor = None
+        for candidata_id, blob in cursor.fetchall():
+            similaridade = duplicatas.similaridade_estimada(
+                assinatura, duplicatas.desserializar(blob))
+            if similaridade >= DUPLICATAS["limiar_similaridade"] and (
+                    melhor is None or similaridade > melhor[1]):
+                melhor = (candidata_id, similaridade)
+
+        cursor.execute(
+            "INSERT INTO minhash_assinaturas (transcricao_id, assinatura) VALUES (?, ?)",
+            (tid, duplicatas.serializar(assinatura))
+        )
+        cursor.executemany(
+            "INSERT INTO lsh_buckets (banda, hash, transcricao_id) VALUES (?, ?, ?)",
+            [(banda, h, tid) for banda, h in enumerate(bandas)]
+        )
+        if melhor:
+            cursor.execute("""
+                INSERT INTO quase_duplicatas (transcricao_id, candidata_id, similaridade)
+                VALUES (?, ?, ?)
+            """, (tid, melhor[0], melhor[1]))
+            logger.info(f"🔁 Quase-duplicata: ID {tid} ≈ ID {melhor[0]} ({melhor[1]:.0%})")
+
+    def _gravar_parametros(self, cursor, tid, user_id, texto):
+        """Grava sinais vitais e doses extraídos do texto (sem commit)."""
+        cursor.executemany("""
+            INSERT INTO parametros_clinicos
+            (transcricao_id, telegram_user_id, parametro, valor, unidade, medicamento, trecho)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(tid, user_id, p["parametro"], p["valor"], p["unidade"], p["medicamento"], p["trecho"])
+              for p in extrair_parametros(texto)])
+
+    def buscar_por_parametro(self, user_id, parametro, minimo, maximo=None, limite=20):
+        """Transcrições com um sinal vital na faixa [minimo, maximo] (busca indexada)."""
+        try:
+            linhas = self._consultar_parametros("""
+                SELECT transcricao_id, valor, unidade, trecho
+                FROM {tabela}
+                WHERE parametro = ? AND valor BETWEEN ? AND ?
+                  AND telegram_user_id = ?
+                ORDER BY valor DESC
+                LIMIT ?
+            """, (parametro, minimo, maximo if maximo is not None else float("inf"),
+                  user_id, limite))
+            linhas.sort(key=lambda linha: linha[1], reverse=True)
+            return self._com_data_hora(linhas[:limite])
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar parâmetro: {e}")
+            return []
+
+    def buscar_doses(self, user_id, medicamento, limite=20):
+        """Doses registradas de um medicamento (prefixo do nome normalizado)."""
+        try:
+            linhas = self._consultar_parametros("""
+                SELECT transcricao_id, valor, unidade, medicamento
+                FROM {tabela}
+                WHERE parametro = 'DOSE' AND medicamento >= ? AND medicamento < ?
+                  AND telegram_user_id = ?
+                ORDER BY transcricao_id DESC
+                LIMIT ?
+            """, (medicamento, medicamento + "\uffff", user_id, limite))
+            linhas.sort(key=lambda linha: linha[0], reverse=True)
+            return self._com_data_hora(linhas[:limite])
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar doses: {e}")
+            return []
+
+    def _com_data_hora(self, linhas):
+        """Acrescenta data_hora (de qualquer camada) a linhas cujo 1º campo é o ID."""
+        registros = self._buscar_linhas([linha[0] for linha in linhas], "id, data_hora")
+        return [(*linha, registros[linha[0]]["data_hora"]) for linha in linhas if linha[0] in registros]
+
+    def definir_paciente(self, transcricao_id, user_id, nome):
+        """Associa a transcrição (em qualquer camada) a um paciente (criado se necessário)."""
+        try:
+            with self._camada_da_transcricao(transcricao_id) as tabela:
+                try:
+                    cursor = self.conn.cursor()
+                    paciente_id = registrar_paciente(cursor, user_id, nome)
+                    if not paciente_id:
+                        self.conn.rollback()
+                        return None
+                    cursor.execute(f"""
+                        UPDATE {tabela} SET paciente_nome = ?, paciente_id = ?
+                        WHERE id = ? AND telegram_user_id = ?
+                    """, (" ".join(nome.split()), paciente_id, transcricao_id, user_id))
+                    if cursor.rowcount == 0:
+                        self.conn.rollback()
+                        return None
+                    # A linha do tempo de arquivadas é lida do mapa
+                    cursor.execute("UPDATE arquivo_mapa SET paciente_id = ? WHERE transcricao_id = ?",
+                                   (paciente_id, transcricao_id))
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            self.cache.invalidar(transcricao_id)
+            logger.info(f"✅ Paciente {paciente_id} associado (ID: {transcricao_id})")
+            return paciente_id
+        except Exception as e:
+            logger.error(f"❌ Erro ao definir paciente: {e}")
+            return None
+
+    def buscar_pacientes(self, user_id, consulta, limite=5, minimo=0.3):
+        """
+        Busca aproximada por nome via índice de trigramas.
+        Retorna [(paciente_id, nome, similaridade)] em ordem decrescente.
+        """
+        grams = trigramas(consulta)
+        if not grams:
+            return []
         try:
             cursor = self.conn.cursor()
+            marcadores = ",".join("?" * len(grams))
+            # Como similaridade <= comuns / len(grams), o HAVING descarta cedo
+            # quem não tem trigramas suficientes em comum, antes do JOIN
+            cursor.execute(f"""
+                SELECT p.id, p.nome, p.num_trigramas, g.comuns
+                FROM (
+                    SELECT paciente_id, COUNT(*) AS comuns
+                    FROM paciente_trigramas
+                    WHERE trigrama IN ({marcadores})
+                    GROUP BY paciente_id
+                    HAVING COUNT(*) >= ?
+                ) g
+                JOIN pacientes p ON p.id = g.paciente_id
+                WHERE p.telegram_user_id = ?
+            """, (*grams, math.ceil(minimo * len(grams)), user_id))
+            resultados = []
+            for paciente_id, nome, num_trigramas, comuns in cursor.fetchall():
+                # Jaccard a partir das contagens: |A∩B| / (|A| + |B| - |A∩B|)
+                sim = comuns / (len(grams) + num_trigramas - comuns)
+                if sim >= minimo:
+                    resultados.append((paciente_id, nome, sim))
+            resultados.sort(key=lambda r: r[2], reverse=True)
+            return resultados[:limite]
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar paciente: {e}")
+            return []
+
+    def nome_paciente(self, paciente_id, user_id):
+        """Nome do paciente (do usuário) ou None."""
+        try:
+            linha = self.conn.execute(
+                "SELECT nome FROM pacientes WHERE id = ? AND telegram_user_id = ?",
+                (paciente_id, user_id)
+            ).fetchone()
+            return linha[0] if linha else None
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar paciente: {e}")
+            return None
+
+    def linha_do_tempo_paciente(self, paciente_id, user_id, limite=None, offset=0):
+        """
+        (total, página) das transcrições do paciente em ordem cronológica.
+        Arquivadas vêm antes das quentes; só as da página são lidas dos arquivos.
+        """
+        try:
+            cursor = self.conn.cursor()
+            # Transcrições arquivadas do paciente: o mapa diz em quais meses estão
             cursor.execute("""
-                SELECT id, data_hora, tipo_documento, categorias, transcricao_formatada
-                FROM transcricoes
-                WHERE categorias LIKE ?
-                ORDER BY data_hora DESC
-                LIMIT ? OFFSET ?
-            """, (f'%"{categoria}"%', limite, offset))
-            return cursor.fetchall()
+                SELECT transcricao_id FROM arquivo_mapa
+                WHERE paciente_id = ? AND telegram_user_id = ?
+                ORDER BY mes, transcricao_id
+            """, (paciente_id, user_id))
+            ids_arquivados = [r[0] for r in cursor.fetchall()]
+            quentes = cursor.execute("""
+                SELECT COUNT(*) FROM transcricoes WHERE paciente_id = ? AND telegram_user_id = ?
+            """, (paciente_id, user_id)).fetchone()[0]
+            total = len(ids_arquivados) + quentes
+            fim = total if limite is None else min(total, offset + limite)
+
+            arquivadas = self._buscar_linhas(
+                ids_arquivados[offset:fim], "id, data_hora, tipo_documento, preview_telegram"
+            )
+            linhas = sorted((tuple(r.values()) for r in arquivadas.values()), key=lambda r: r[1])
+
+            inicio_quente = max(0, offset - len(ids_arquivados))
+            if fim > len(ids_arquivados):
+                cursor.execute("""
+                    SELECT id, data_hora, tipo_documento, preview_telegram
+                    FROM transcricoes
+                    WHERE paciente_id = ? AND telegram_user_id = ?
+                    ORDER BY data_hora, id
+                    LIMIT ? OFFSET ?
+                """, (paciente_id, user_id, fim - len(ids_arquivados) - inicio_quente, inicio_quente))
+                linhas += [tuple(r) for r in cursor.fetchall()]
+            return total, linhas
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar linha do tempo: {e}")
+            return 0, []
+
+    def buscar_quase_duplicata(self, transcricao_id):
+        """Retorna a quase-duplicata pendente (candidata_id, similaridade) ou None."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT candidata_id, similaridade
+                FROM quase_duplicatas
+                WHERE transcricao_id = ?
+            """, (transcricao_id,))
+            return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar duplicata: {e}")
+            return None
+
+    def vincular_versao(self, transcricao_id, anterior_id):
+        """Mantém as duas e marca a nova como versão da anterior."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE transcricoes SET versao_de = ? WHERE id = ?",
+                           (anterior_id, transcricao_id))
+            cursor.execute("DELETE FROM quase_duplicatas WHERE transcricao_id = ?",
+                           (transcricao_id,))
+            self.conn.commit()
+            self.cache.invalidar(transcricao_id)
+            logger.info(f"✅ ID {transcricao_id} vinculado como versão do ID {anterior_id}")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"❌ Erro ao vincular: {e}")
+            return False
+
+    def substituir_transcricao(self, transcricao_id, anterior_id):
+        """
+        Substitui a anterior pela nova: herda as tags e exclui a anterior.
+        Retorna as tags que deixaram de existir (já estavam na nova) ou None se falhar.
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("UPDATE OR IGNORE tags SET transcricao_id = ? WHERE transcricao_id = ?",
+                           (transcricao_id, anterior_id))
+            # As que sobraram na anterior são repetidas e somem com ela
+            removidas = [r[0] for r in cursor.execute(
+                "SELECT tag FROM tags WHERE transcricao_id = ?", (anterior_id,))]
+            cursor.execute("UPDATE transcricoes SET versao_de = ? WHERE versao_de = ?",
+                           (transcricao_id, anterior_id))
+            cursor.execute("DELETE FROM quase_duplicatas WHERE transcricao_id = ?",
+                           (transcricao_id,))
+            self._excluir(cursor, anterior_id)
+            self.conn.commit()
+            self.cache.invalidar(transcricao_id)
+            self.cache.invalidar(anterior_id)
+            logger.info(f"✅ ID {anterior_id} substituído pelo ID {transcricao_id}")
+            return removidas
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"❌ Erro ao substituir: {e}")
+            return None
+
+    def descartar_quase_duplicata(self, transcricao_id):
+        """Mantém as duas transcrições sem vínculo."""
+        try:
+            self.conn.execute("DELETE FROM quase_duplicatas WHERE transcricao_id = ?",
+                              (transcricao_id,))
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao descartar duplicata: {e}")
+            return False
+
+    def _excluir(self, cursor, transcricao_id):
+        """Remove a transcrição e tudo que depende dela (sem commit)."""
+        cursor.execute("DELETE FROM tags WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM fila_exportacao WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM transcricao_mensagens WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM parametros_clinicos WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM lsh_buckets WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM minhash_assinaturas WHERE transcricao_id = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM quase_duplicatas WHERE transcricao_id = ? OR candidata_id = ?",
+                       (transcricao_id, transcricao_id))
+        cursor.execute("UPDATE transcricoes SET versao_de = NULL WHERE versao_de = ?", (transcricao_id,))
+        cursor.execute("DELETE FROM transcricoes WHERE id = ?", (transcricao_id,))
+        # Se já estava arquivada, sai do mapa: a linha no arquivo mensal fica órfã e é ignorada
+        cursor.execute("""
+            UPDATE arquivo_meses SET total = total - 1
+            WHERE mes = (SELECT mes FROM arquivo_mapa WHERE transcricao_id = ?)
+        """, (transcricao_id,))
+        cursor.execute("DELETE FROM arquivo_mapa WHERE transcricao_id = ?", (transcricao_id,))
+
+    def buscar_por_categoria(self, categoria, limite=10, offset=0, user_id=None):
+        """Busca transcrições por categoria (em todas as camadas); limite=None traz todas."""
+        try:
+            # Categorias são gravadas com json.dumps: compara na mesma codificação
+            filtro = "categorias LIKE ?"
+            params = [f"%{json.dumps(categoria)}%"]
+            if user_id is not None:
+                filtro += " AND telegram_user_id = ?"
+                params.append(user_id)
+            sql = f"""
+                SELECT id, data_hora, criado_em, tipo_documento, categorias,
+                       transcricao_formatada, preview_telegram
+                FROM {{tabela}}
+                WHERE {filtro}
+                ORDER BY data_hora DESC, id DESC
+                LIMIT ?
+            """
+            necessarias = None if limite is None else limite + offset
+            linhas = [dict(r) for r in self.conn.execute(
+                sql.format(tabela="main.transcricoes"), (*params, -1 if necessarias is None else necessarias))]
+
+            # Arquivadas são sempre mais antigas: só abre arquivos (do mais recente) se faltar linha
+            for mes in reversed(self._meses_arquivados()):
+                if necessarias is not None and len(linhas) >= necessarias:
+                    break
+                with self._anexar_arquivo(mes):
+                    linhas += [dict(r) for r in self.conn.execute(
+                        sql.format(tabela=self._ARQUIVADAS),
+                        (*params, -1 if necessarias is None else necessarias - len(linhas)))]
+            return linhas[offset:necessarias]
         except Exception as e:
             logger.error(f"❌ Erro ao buscar: {e}")
             return []
 
     def buscar_por_periodo(self, dias=7, limite=10):
-        """Busca transcrições dos últimos N dias."""
+        """Busca transcrições dos últimos N dias (só abre arquivos do período)."""
         try:
-            cursor = self.conn.cursor()
-            data_inicio = datetime.now() - timedelta(days=dias)
-            cursor.execute("""
+            data_inicio = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+            linhas = self._consultar_camadas("""
                 SELECT id, data_hora, tipo_documento, categorias
-                FROM transcricoes
+                FROM {tabela}
                 WHERE data_hora >= ?
                 ORDER BY data_hora DESC
                 LIMIT ?
-            """, (data_inicio.isoformat(), limite))
-            return cursor.fetchall()
+            """, (data_inicio, limite), inicio=data_inicio)
+            linhas.sort(key=lambda r: (r["data_hora"], r["id"]), reverse=True)
+            return linhas[:limite]
         except Exception as e:
             logger.error(f"❌ Erro ao buscar por período: {e}")
             return []
 
-    def buscar_ultimas(self, limite=5):
-        """Retorna as últimas N transcrições."""
+    def buscar_ultimas(self, limite=5, user_id=None):
+        """Retorna as últimas N transcrições (do usuário, se informado, via cache)."""
+        if user_id is not None:
+            em_cache = self.cache.obter(("ultimas", user_id, limite))
+            if em_cache is not None:
+                return em_cache
         try:
             cursor = self.conn.cursor()
-            cursor.execute("""
+            filtro = "WHERE telegram_user_id = ?" if user_id is not None else ""
+            params = (user_id, limite) if user_id is not None else (limite,)
+            cursor.execute(f"""
                 SELECT id, data_hora, tipo_documento, categorias, transcricao_formatada
                 FROM transcricoes
-                ORDER BY data_hora DESC
+                {filtro}
+                ORDER BY data_hora DESC, id DESC
                 LIMIT ?
-            """, (limite,))
-            return cursor.fetchall()
+            """, params)
+            resultados = [dict(r) for r in cursor.fetchall()]
+
+            # Poucas no banco quente: completa com os arquivos mais recentes
+            for mes in reversed(self._meses_arquivados()):
+                if len(resultados) >= limite:
+                    break
+                with self._anexar_arquivo(mes):
+                    cursor.execute(f"""
+                        SELECT id, data_hora, tipo_documento, categorias, transcricao_formatada
+                        FROM {self._ARQUIVADAS}
+                        {filtro}
+                        ORDER BY data_hora DESC, id DESC
+                        LIMIT ?
+                    """, params[:-1] + (limite - len(resultados),))
+                    resultados += [dict(r) for r in cursor.fetchall()]
+
+            if user_id is not None:
+                self.cache.guardar(("ultimas", user_id, limite), resultados)
+            return resultados
         except Exception as e:
             logger.error(f"❌ Erro ao buscar últimas: {e}")
             return []
 
     def buscar_por_id(self, transcricao_id):
-        """Busca transcrição específica por ID."""
+        """Busca transcrição específica por ID (via cache)."""
+        em_cache = self.cache.obter(("id", transcricao_id))
+        if em_cache is not None:
+            return em_cache
         try:
             cursor = self.conn.cursor()
             cursor.execute("""
                 SELECT * FROM transcricoes WHERE id = ?
             """, (transcricao_id,))
-            return cursor.fetchone()
+            registro = cursor.fetchone()
+            if registro is not None:
+                registro = dict(registro)
+            else:
+                registro = self._buscar_linhas([transcricao_id]).get(transcricao_id)
+                if registro is None:
+                    return None
+            self.cache.guardar(("id", transcricao_id), registro)
+            return registro
         except Exception as e:
             logger.error(f"❌ Erro ao buscar por ID: {e}")
             return None
 
+    def aquecer_cache(self, user_ids, limite):
+        """Pré-carrega no cache as últimas N transcrições de cada usuário."""
+        total = 0
+        try:
+            cursor = self.conn.cursor()
+            for user_id in user_ids:
+                cursor.execute("""
+                    SELECT * FROM transcricoes
+                    WHERE telegram_user_id = ?
+                    ORDER BY data_hora DESC, id DESC
+                    LIMIT ?
+                """, (user_id, limite))
+                registros = [dict(r) for r in cursor.fetchall()]
+                for registro in reversed(registros):
+                    self.cache.guardar(("id", registro["id"]), registro)
+                self.cache.guardar(("ultimas", user_id, 5), registros[:5])
+                total += len(registros)
+            logger.info(f"✅ Cache aquecido: {total} transcrições de {len(user_ids)} usuários")
+        except Exception as e:
+            logger.error(f"❌ Erro ao aquecer cache: {e}")
+        return total
+
     def editar_categoria(self, transcricao_id, novas_categorias):
-        """Edita categorias de uma transcrição."""
+        """Edita categorias de uma transcrição (em qualquer camada); False se não existir."""
         try:
+            with self._camada_da_transcricao(transcricao_id) as tabela:
+                try:
+                    cursor = self.conn.cursor()
+                    cursor.execute(f"""
+                        UPDATE {tabela}
+                        SET categorias = ?, editado = 1
+                        WHERE id = ?
+                    """, (json.dumps(novas_categorias), transcricao_id))
+                    editadas = cursor.rowcount
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            if not editadas:
+                return False
+            self.cache.invalidar(transcricao_id)
+            logger.info(f"✅ Categoria editada (ID: {transcricao_id})")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao editar: {e}")
+            return False
+
+    def adicionar_tag(self, transcricao_id, tag):
+        """
+        Adiciona tag (já normalizada) a uma transcrição.
+        Retorna True se foi criada, False se já existia ou em caso de erro.
+        """
+        try:
+            registro = self.buscar_por_id(transcricao_id)
+            if registro is None:
+                return False
             cursor = self.conn.cursor()
             cursor.execute("""
-                UPDATE transcricoes
-                SET categorias = ?, editado = 1
-                WHERE id = ?
-            """, (json.dumps(novas_categorias), transcricao_id))
+                INSERT OR IGNORE INTO tags (transcricao_id, tag, data_criacao, telegram_user_id)
+                VALUES (?, ?, ?, ?)
+            """, (transcricao_id, tag, datetime.now().isoformat(), registro["telegram_user_id"]))
             self.conn.commit()
-            logger.info(f"✅ Categoria editada (ID: {transcricao_id})")
+            if cursor.rowcount == 0:
+                return False
+            self.cache.invalidar(transcricao_id)
+            logger.info(f"✅ Tag '{tag}' adicionada (ID: {transcricao_id})")
             return True
         except Exception as e:
-            logger.error(f"❌ Erro ao editar: {e}")
+            logger.error(f"❌ Erro ao adicionar tag: {e}")
             return False
 
-    def marcar_enviado_hf(self, transcricao_id):
-        """Marca transcrição como enviada para HF."""
+    def buscar_por_tag(self, user_id, tag, limite=None, offset=0):
+        """
+        Transcrições do usuário com a tag, mais recentes primeiro (índice em
+        tags(telegram_user_id, tag)). limite=None traz todas.
+        """
         try:
             cursor = self.conn.cursor()
+            # IDs crescem com criado_em: a página é cortada antes de abrir arquivos
             cursor.execute("""
-                UPDATE transcricoes
-                SET enviado_hf = 1
-                WHERE id = ?
-            """, (transcricao_id,))
+                SELECT transcricao_id FROM tags
+                WHERE telegram_user_id = ? AND tag = ?
+                ORDER BY transcricao_id DESC
+                LIMIT ? OFFSET ?
+            """, (user_id, tag, -1 if limite is None else limite, offset))
+            registros = self._buscar_linhas(
+                [r[0] for r in cursor.fetchall()], "id, preview_telegram, criado_em"
+            )
+            return sorted((tuple(r.values()) for r in registros.values()),
+                          key=lambda r: (r[2], r[0]), reverse=True)
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar por tag: {e}")
+            return []
+
+    def contagens_tags(self, user_id=None, limite=None):
+        """Contagens mantidas por trigger: [(user_id, tag, total)], mais usadas primeiro."""
+        try:
+            cursor = self.conn.cursor()
+            filtro = "WHERE telegram_user_id = ?" if user_id is not None else ""
+            params = (user_id,) if user_id is not None else ()
+            cursor.execute(f"""
+                SELECT telegram_user_id, tag, total
+                FROM tag_contagens
+                {filtro}
+                ORDER BY total DESC, tag
+                LIMIT ?
+            """, (*params, -1 if limite is None else limite))
+            return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"❌ Erro ao contar tags: {e}")
+            return []
+
+    def enfileirar_exportacao(self, transcricao_id, destino="HF"):
+        """Coloca transcrição na fila de exportação (uma vez por destino)."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO fila_exportacao (transcricao_id, destino)
+                VALUES (?, ?)
+            """, (transcricao_id, destino))
             self.conn.commit()
+            logger.info(f"✅ Enfileirado para {destino} (ID: {transcricao_id})")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erro ao enfileirar: {e}")
+            return False
+
+    def marcar_enviado_hf(self, transcricao_id):
+        """Marca transcrição (em qualquer camada) como enviada para HF."""
+        try:
+            with self._camada_da_transcricao(transcricao_id) as tabela:
+                try:
+                    cursor = self.conn.cursor()
+                    cursor.execute(f"""
+                        UPDATE {tabela}
+                        SET enviado_hf = 1
+                        WHERE id = ?
+                    """, (transcricao_id,))
+                    self.conn.commit()
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            self.cache.invalidar(transcricao_id)
             logger.info(f"✅ Marcado como enviado (ID: {transcricao_id})")
             return True
         except Exception as e:
             logger.error(f"❌ Erro ao marcar: {e}")
             return False
 
+    def contar_transcricoes(self):
+        """Total de transcrições no banco (quente + arquivadas)."""
+        try:
+            quentes = self.conn.execute("SELECT COUNT(*) FROM transcricoes").fetchone()[0]
+            arquivadas = self.conn.execute("SELECT COUNT(*) FROM arquivo_mapa").fetchone()[0]
+            return quentes + arquivadas
+        except Exception as e:
+            logger.error(f"❌ Erro ao contar: {e}")
+            return 0
+
+    def iterar_textos(self):
+        """Itera (id, user_id, texto formatado) das arquivadas e depois do banco quente."""
+        sql = "SELECT id, telegram_user_id, transcricao_formatada FROM {tabela} ORDER BY id"
+        for mes in self._meses_arquivados():
+            with self._anexar_arquivo(mes):
+                linhas = self.conn.execute(sql.format(tabela=self._ARQUIVADAS)).fetchall()
+            for linha in linhas:
+                yield tuple(linha)
+        for linha in self.conn.execute(sql.format(tabela="main.transcricoes")):
+            yield tuple(linha)
+
     def estatisticas_categorias(self):
-        """Retorna estatísticas por categoria."""
+        """Retorna estatísticas por categoria (todas as camadas)."""
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                SELECT categorias, COUNT(*) as total
-                FROM transcricoes
-                GROUP BY categorias
-                ORDER BY total DESC
-            """)
-            return cursor.fetchall()
+            return self._somar_camadas("categorias")
         except Exception as e:
             logger.error(f"❌ Erro ao gerar estatísticas: {e}")
             return []
 
     def estatisticas_tipos(self):
-        """Retorna estatísticas por tipo de documento."""
+        """Retorna estatísticas por tipo de documento (todas as camadas)."""
+        try:
+            return self._somar_camadas("tipo_documento")
+        except Exception as e:
+            logger.error(f"❌ Erro ao gerar estatísticas: {e}")
+            return []
+
+    # ============================================
+    # RELATÓRIOS (AGREGADOS INCREMENTAIS)
+    # ============================================
+
+    def atualizar_agregados_relatorio(self):
+        """
+        Soma nos agregados diários apenas as transcrições novas desde a última
+        execução (cursor em relatorio_estado). Dia e hora são os do fuso dos
+        relatórios (data_hora é gravado em UTC). Retorna quantas foram processadas.
+        """
         try:
             cursor = self.conn.cursor()
+            linha = cursor.execute(
+                "SELECT valor FROM relatorio_estado WHERE chave = 'ultimo_id'"
+            ).fetchone()
+            ultimo_id = linha[0] if linha else 0
+
             cursor.execute("""
-                SELECT tipo_documento, COUNT(*) as total
+                SELECT id, telegram_user_id, data_hora,
+                       tipo_documento, categorias, COALESCE(audio_duracao, 0) AS duracao
                 FROM transcricoes
-                GROUP BY tipo_documento
-                ORDER BY total DESC
-            """)
-            return cursor.fetchall()
+                WHERE id > ?
+                ORDER BY id
+            """, (ultimo_id,))
+            linhas = cursor.fetchall()
+            if not linhas:
+                return 0
+
+            somas = Counter()
+            duracoes = Counter()
+            for r in linhas:
+                local = datetime.fromisoformat(r["data_hora"]).replace(
+                    tzinfo=timezone.utc).astimezone(RELATORIOS["fuso"])
+                dia = local.date().isoformat()
+                chaves = [("total", ""), ("tipo", r["tipo_documento"] or ""), ("hora", f"{local.hour:02d}")]
+                chaves += [("categoria", c) for c in json.loads(r["categorias"] or "[]")]
+                for dimensao, chave in chaves:
+                    somas[(r["telegram_user_id"], dia, dimensao, chave)] += 1
+                    duracoes[(r["telegram_user_id"], dia, dimensao, chave)] += r["duracao"]
+
+            cursor.executemany("""
+                INSERT INTO relatorio_agregados (telegram_user_id, dia, dimensao, chave, total, soma_duracao)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (telegram_user_id, dia, dimensao, chave) DO UPDATE SET
+                    total = total + excluded.total,
+                    soma_duracao = soma_duracao + excluded.soma_duracao
+            """, [(*k, total, duracoes[k]) for k, total in somas.items()])
+            cursor.execute("""
+                INSERT INTO relatorio_estado (chave, valor) VALUES ('ultimo_id', ?)
+                ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor
+            """, (linhas[-1]["id"],))
+            self.conn.commit()
+            logger.info(f"📈 Agregados de relatório atualizados: {len(linhas)} transcrições")
+            return len(linhas)
         except Exception as e:
-            logger.error(f"❌ Erro ao gerar estatísticas: {e}")
-            return []
+            self.conn.rollback()
+            logger.error(f"❌ Erro ao atualizar agregados: {e}")
+            return 0
+
+    def agregar_relatorio(self, user_id, inicio, fim):
+        """Totais do usuário entre os dias [inicio, fim) a partir dos agregados diários (None se falhar)."""
+        dados = {"inicio": inicio, "fim": fim, "total": 0, "duracao_media": 0.0,
+                 "categorias": [], "tipos": [], "horas": [0] * 24}
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT dimensao, chave, SUM(total) AS total, SUM(soma_duracao) AS duracao
+                FROM relatorio_agregados
+                WHERE telegram_user_id = ? AND dia >= ? AND dia < ?
+                GROUP BY dimensao, chave
+            """, (user_id, inicio, fim))
+
+            for r in cursor.fetchall():
+                if r["dimensao"] == "total":
+                    dados["total"] = r["total"]
+                    dados["duracao_media"] = r["duracao"] / r["total"] if r["total"] else 0.0
+                elif r["dimensao"] == "hora":
+                    dados["horas"][int(r["chave"])] = r["total"]
+                elif r["dimensao"] == "categoria":
+                    dados["categorias"].append((r["chave"], r["total"]))
+                elif r["dimensao"] == "tipo":
+                    dados["tipos"].append((r["chave"], r["total"]))
+            dados["categorias"].sort(key=lambda c: -c[1])
+            dados["tipos"].sort(key=lambda t: -t[1])
+        except Exception as e:
+            logger.error(f"❌ Erro ao agregar relatório: {e}")
+            return None
+        return dados
+
+    def salvar_snapshot_relatorio(self, user_id, periodo, dados, grafico=None):
+        """Grava (substitui) o snapshot do período: dados em JSON e gráfico PNG opcional."""
+        try:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO relatorio_snapshots
+                (telegram_user_id, periodo, inicio, fim, dados, grafico, gerado_em)
+                VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (user_id, periodo, dados["inicio"], dados["fim"],
+                  json.dumps(dados, ensure_ascii=False), grafico))
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"❌ Erro ao salvar snapshot de relatório: {e}")
+
+    def buscar_snapshot_relatorio(self, user_id, periodo):
+        """(dados, grafico PNG, gerado_em) do último snapshot ou None."""
+        try:
+            linha = self.conn.execute("""
+                SELECT dados, grafico, gerado_em FROM relatorio_snapshots
+                WHERE telegram_user_id = ? AND periodo = ?
+            """, (user_id, periodo)).fetchone()
+            if linha is None:
+                return None
+            return json.loads(linha["dados"]), linha["grafico"], linha["gerado_em"]
+        except Exception as e:
+            logger.error(f"❌ Erro ao buscar snapshot de relatório: {e}")
+            return None
+
+    # ============================================
+    # CAMADAS: BANCO QUENTE + ARQUIVOS MENSAIS
+    # ============================================
+
+    # Linhas do arquivo anexado que ainda constam no mapa (exclusões só removem do mapa)
+    _ARQUIVADAS = "(SELECT * FROM arq.transcricoes WHERE id IN (SELECT transcricao_id FROM main.arquivo_mapa))"
+    _PARAMETROS_ARQUIVADOS = ("(SELECT * FROM arq.parametros_clinicos "
+                              "WHERE transcricao_id IN (SELECT transcricao_id FROM main.arquivo_mapa))")
+    # Tabelas copiadas para o arquivo mensal → índices criados lá
+    _TABELAS_ARQUIVO = {
+        "transcricoes": [("idx_arq_user", "telegram_user_id, data_hora"), ("idx_arq_data", "data_hora")],
+        "parametros_clinicos": [("idx_arq_param_valor", "parametro, valor"),
+                                ("idx_arq_param_medicamento", "parametro, medicamento")],
+        "transcricao_mensagens": [("idx_arq_mensagens_origem", "telegram_message_id")],
+    }
+
+    def _caminho_arquivo(self, mes):
+        return os.path.join(ARQUIVO["diretorio"], f"lince_{mes.replace('-', '_')}.db")
+
+    @contextmanager
+    def _camada_da_transcricao(self, transcricao_id):
+        """
+        Nome da tabela onde a transcrição está para UPDATEs: main.transcricoes
+        ou arq.transcricoes (arquivo mensal anexado durante o bloco). O commit
+        deve acontecer dentro do bloco, antes do DETACH.
+        """
+        linha = self.conn.execute(
+            "SELECT mes FROM arquivo_mapa WHERE transcricao_id = ?", (transcricao_id,)
+        ).fetchone()
+        if linha is None:
+            yield "main.transcricoes"
+            return
+        with self._anexar_arquivo(linha["mes"]):
+            yield "arq.transcricoes"
+
+    @contextmanager
+    def _anexar_arquivo(self, mes):
+        """ATTACH do arquivo mensal como 'arq' apenas durante o bloco."""
+        self.conn.execute("ATTACH DATABASE ? AS arq", (self._caminho_arquivo(mes),))
+        try:
+            yield
+        finally:
+            self.conn.execute("DETACH DATABASE arq")
+
+    def _meses_arquivados(self, inicio=None, fim=None):
+        """Meses (AAAA-MM) com arquivo que intersectam o intervalo de data_hora."""
+        filtro, params = [], []
+        if inicio:
+            filtro.append("mes >= ?")
+            params.append(inicio[:7])
+        if fim:
+            filtro.append("mes <= ?")
+            params.append(fim[:7])
+        where = f"WHERE {' AND '.join(filtro)}" if filtro else ""
+        return [r[0] for r in self.conn.execute(
+            f"SELECT mes FROM arquivo_meses {where} ORDER BY mes", params)]
+
+    def _consultar_camadas(self, sql, params=(), inicio=None, fim=None):
+        """
+        Executa a consulta (com {tabela}) no banco quente e nos arquivos mensais
+        do intervalo. Retorna dicts; ordenar/limitar o conjunto é do chamador.
+        """
+        linhas = [dict(r) for r in self.conn.execute(sql.format(tabela="main.transcricoes"), params)]
+        for mes in self._meses_arquivados(inicio, fim):
+            with self._anexar_arquivo(mes):
+                linhas += [dict(r) for r in self.conn.execute(
+                    sql.format(tabela=self._ARQUIVADAS), params)]
+        return linhas
+
+    def _consultar_parametros(self, sql, params=()):
+        """Como _consultar_camadas, mas sobre parametros_clinicos (sem filtro de data)."""
+        linhas = [tuple(r) for r in self.conn.execute(sql.format(tabela="main.parametros_clinicos"), params)]
+        for mes in self._meses_arquivados():
+            with self._anexar_arquivo(mes):
+                # Arquivos anteriores à cópia dos parâmetros não têm a tabela
+                if self.conn.execute("SELECT 1 FROM arq.sqlite_master WHERE name = 'parametros_clinicos'").fetchone():
+                    linhas += [tuple(r) for r in self.conn.execute(
+                        sql.format(tabela=self._PARAMETROS_ARQUIVADOS), params)]
+        return linhas
+
+    def _buscar_linhas(self, ids, colunas="*"):
+        """Linhas por ID em qualquer camada: {id: dict}. Arquivos só são abertos se preciso."""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        marcadores = ",".join("?" * len(ids))
+        encontrados = {r["id"]: dict(r) for r in self.conn.execute(
+            f"SELECT {colunas} FROM main.transcricoes WHERE id IN ({marcadores})", ids)}
+
+        faltantes = [i for i in ids if i not in encontrados]
+        if faltantes:
+            marcadores = ",".join("?" * len(faltantes))
+            por_mes = {}
+            for tid, mes in self.conn.execute(
+                    f"SELECT transcricao_id, mes FROM arquivo_mapa WHERE transcricao_id IN ({marcadores})",
+                    faltantes):
+                por_mes.setdefault(mes, []).append(tid)
+            for mes, tids in por_mes.items():
+                marcadores = ",".join("?" * len(tids))
+                with self._anexar_arquivo(mes):
+                    encontrados.update({r["id"]: dict(r) for r in self.conn.execute(
+                        f"SELECT {colunas} FROM arq.transcricoes WHERE id IN ({marcadores})", tids)})
+        return encontrados
+
+    def _somar_camadas(self, coluna):
+        """GROUP BY coluna somado entre camadas: [(valor, total)] em ordem decrescente."""
+        totais = Counter()
+        for linha in self._consultar_camadas(
+                f"SELECT {coluna} AS chave, COUNT(*) AS total FROM {{tabela}} GROUP BY {coluna}"):
+            totais[linha["chave"]] += linha["total"]
+        return totais.most_common()
+
+    def _preparar_arquivo(self, tabela="transcricoes"):
+        """Cria/atualiza arq.<tabela> com as mesmas colunas do banco quente."""
+        colunas = [(r["name"], r["type"]) for r in self.conn.execute(f"PRAGMA main.table_info({tabela})")]
+        existentes = {r["name"] for r in self.conn.execute(f"PRAGMA arq.table_info({tabela})")}
+        if not existentes:
+            definicoes = ", ".join(
+                "id INTEGER PRIMARY KEY" if nome == "id" else f"{nome} {tipo}" for nome, tipo in colunas
+            )
+            self.conn.execute(f"CREATE TABLE arq.{tabela} ({definicoes})")
+            for indice, indexadas in self._TABELAS_ARQUIVO[tabela]:
+                self.conn.execute(f"CREATE INDEX arq.{indice} ON {tabela}({indexadas})")
+        else:
+            # Migrações posteriores podem ter criado colunas novas no banco quente
+            for nome, tipo in colunas:
+                if nome not in existentes:
+                    self.conn.execute(f"ALTER TABLE arq.{tabela} ADD COLUMN {nome} {tipo}")
+        return [nome for nome, _ in colunas]
+
+    def arquivar_lote(self, dias=None, lote=None):
+        """
+        Move até `lote` transcrições mais antigas que `dias` para os arquivos
+        mensais (um ATTACH por mês envolvido). Retorna quantas foram movidas.
+        """
+        dias = ARQUIVO["dias_quente"] if dias is None else dias
+        lote = ARQUIVO["lote"] if lote is None else lote
+        limite = (datetime.now(timezone.utc) - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+
+        antigas = self.conn.execute("""
+            SELECT id, substr(data_hora, 1, 7) AS mes
+            FROM transcricoes
+            WHERE data_hora < ?
+            ORDER BY data_hora
+            LIMIT ?
+        """, (limite, lote)).fetchall()
+        if not antigas:
+            return 0
+
+        por_mes = {}
+        for linha in antigas:
+            por_mes.setdefault(linha["mes"], []).append(linha["id"])
+
+        os.makedirs(ARQUIVO["diretorio"], exist_ok=True)
+        movidas = 0
+        for mes, ids in por_mes.items():
+            marcadores = ",".join("?" * len(ids))
+            with self._anexar_arquivo(mes):
+                try:
+                    colunas = {tabela: ", ".join(self._preparar_arquivo(tabela))
+                               for tabela in self._TABELAS_ARQUIVO}
+                    cursor = self.conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute(f"""
+                        INSERT OR REPLACE INTO arq.transcricoes ({colunas["transcricoes"]})
+                        SELECT {colunas["transcricoes"]} FROM main.transcricoes WHERE id IN ({marcadores})
+                    """, ids)
+                    # Parâmetros e mensagens de origem acompanham a transcrição
+                    for tabela in ("parametros_clinicos", "transcricao_mensagens"):
+                        cursor.execute(f"""
+                            INSERT OR REPLACE INTO arq.{tabela} ({colunas[tabela]})
+                            SELECT {colunas[tabela]} FROM main.{tabela} WHERE transcricao_id IN ({marcadores})
+                        """, ids)
+                        cursor.execute(f"DELETE FROM main.{tabela} WHERE transcricao_id IN ({marcadores})", ids)
+                    # Quase-duplicatas só são procuradas no banco quente: o índice LSH não vai junto
+                    for tabela in ("lsh_buckets", "minhash_assinaturas", "quase_duplicatas"):
+                        cursor.execute(f"DELETE FROM main.{tabela} WHERE transcricao_id IN ({marcadores})", ids)
+                    cursor.execute(f"""
+                        INSERT OR REPLACE INTO arquivo_mapa (transcricao_id, mes, telegram_user_id, paciente_id)
+                        SELECT id, ?, telegram_user_id, paciente_id
+                        FROM main.transcricoes WHERE id IN ({marcadores})
+                    """, (mes, *ids))
+                    cursor.execute(f"DELETE FROM main.transcricoes WHERE id IN ({marcadores})", ids)
+                    cursor.execute("""
+                        INSERT INTO arquivo_meses (mes, total) VALUES (?, ?)
+                        ON CONFLICT (mes) DO UPDATE SET total = total + excluded.total
+                    """, (mes, len(ids)))
+                    self.conn.commit()
+                except Exception as e:
+                    self.conn.rollback()
+                    logger.error(f"❌ Erro ao arquivar {mes}: {e}")
+                    return movidas
+            for tid in ids:
+                self.cache.invalidar(tid)
+            movidas += len(ids)
+            logger.info(f"📦 {len(ids)} transcrições arquivadas em {mes}")
+        return movidas
+
+    def _ativar_vacuum_incremental(self):
+        """
+        auto_vacuum=INCREMENTAL só vale após um VACUUM completo: feito uma vez,
+        na inicialização (antes dos handlers), para o arquivamento poder
+        compactar aos poucos depois.
+        """
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        inicio = time.perf_counter()
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.conn.execute("VACUUM")
+        logger.info(f"🧹 auto_vacuum incremental ativado em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    def compactar_passo(self, paginas=None) -> bool:
+        """
+        Devolve até `paginas` páginas livres ao sistema (PRAGMA incremental_vacuum).
+        Cada passo trava a escrita só por milissegundos; retorna True enquanto
+        restarem páginas livres, para o chamador repetir entre outros eventos.
+        """
+        paginas = ARQUIVO["paginas_por_compactacao"] if paginas is None else paginas
+        try:
+            livres = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # execute() avança só um passo do pragma (uma página); executescript roda até o fim
+            self.conn.executescript(f"PRAGMA incremental_vacuum({int(paginas)})")
+            restantes = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            # Sem progresso (auto_vacuum desativado): não adianta repetir
+            return 0 < restantes < livres
+        except Exception as e:
+            logger.error(f"❌ Erro ao compactar: {e}")
+            return False
 
     def fechar(self):
         """Fecha conexão com banco."""
@@ -0,0 +1,74 @@
+"""
+Detecção de quase-duplicatas com MinHash + LSH (bandas)
+"""
+
+import re
+import random
+import struct
+import hashlib
+import unicodedata
+import zlib
+
+NUM_PERMUTACOES = 64
+BANDAS = 16
+LINHAS_POR_BANDA = NUM_PERMUTACOES // BANDAS
+TAMANHO_SHINGLE = 3
+
+_PRIMO = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Semente fixa: assinaturas precisam ser comparáveis entre execuções
+_rng = random.Random(1742)
+_PERMUTACOES = [(_rng.randrange(1, _PRIMO), _rng.randrange(0, _PRIMO))
+                for _ in range(NUM_PERMUTACOES)]
+
+
+def normalizar_texto(texto: str) -> list:
+    """Minúsculas, sem acentos e sem pontuação; retorna as palavras."""
+    texto = unicodedata.normalize("NFKD", (texto or "").lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.findall(r"[a-z0-9]+", texto)
+
+
+def gerar_shingles(texto: str) -> set:
+    """Conjunto de n-gramas de palavras (hash de 32 bits)."""
+    palavras = normalizar_texto(texto)
+    if len(palavras) < TAMANHO_SHINGLE:
+        grupos = [" ".join(palavras)] if palavras else []
+    else:
+        grupos = [" ".join(palavras[i:i + TAMANHO_SHINGLE])
+                  for i in range(len(palavras) - TAMANHO_SHINGLE + 1)]
+    return {zlib.crc32(g.encode("utf-8")) for g in grupos}
+
+
+def calcular_assinatura(texto: str) -> list:
+    """Assinatura MinHash (NUM_PERMUTACOES mínimos)."""
+    shingles = gerar_shingles(texto)
+    if not shingles:
+        return [_MAX_HASH] * NUM_PERMUTACOES
+    return [min(((a * s + b) % _PRIMO) & _MAX_HASH for s in shingles)
+            for a, b in _PERMUTACOES]
+
+
+def hashes_bandas(assinatura: list) -> list:
+    """Um hash inteiro (64 bits com sinal, cabe no SQLite) por banda."""
+    hashes = []
+    for banda in range(BANDAS):
+        fatia = assinatura[banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA]
+        digest = hashlib.blake2b(struct.pack(f"<{len(fatia)}I", *fatia), digest_size=8).digest()
+        hashes.append(int.from_bytes(digest, "little", signed=True))
+    return hashes
+
+
+def similaridade_estimada(assinatura_a: list, assinatura_b: list) -> float:
+    """Estimativa de Jaccard: fração de posições iguais."""
+    iguais = sum(1 for a, b in zip(assinatura_a, assinatura_b) if a == b)
+    return iguais / NUM_PERMUTACOES
+
+
+def serializar(assinatura: list) -> bytes:
+    return struct.pack(f"<{NUM_PERMUTACOES}I", *assinatura)
+
+
+def desserializar(blob: bytes) -> list:
+    return list(struct.unpack(f"<{NUM_PERMUTACOES}I", blob))
@@ -0,0 +1,154 @@
+"""
+Escalonador de transcrições: menor custo primeiro, com envelhecimento,
+cota justa por usuário e limite global de concorrência
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Voz do Telegram (Opus) tem ~2 KB por segundo: estima a duração quando ela não vem
+_BYTES_POR_SEGUNDO = 2000
+_ALFA_EWMA = 0.2
+
+
+class Tarefa:
+    __slots__ = ("user_id", "duracao", "custo", "chegada", "ordem", "liberada", "ao_mudar", "posicao", "inicio")
+
+    def __init__(self, user_id, duracao, custo, ordem, ao_mudar):
+        self.user_id = user_id
+        self.duracao = duracao
+        self.custo = custo
+        self.chegada = time.monotonic()
+        self.ordem = ordem
+        self.liberada = asyncio.Event()
+        self.ao_mudar = ao_mudar
+        self.posicao = None
+        self.inicio = None
+
+
+class EscalonadorTranscricoes:
+    """
+    Fila em memória na frente da transcrição. A prioridade é o custo estimado
+    (segundos de processamento) menos o tempo já esperado × envelhecimento, então
+    áudios curtos passam à frente mas os longos não esperam para sempre.
+    Enquanto houver outros usuários com trabalho, ninguém ocupa mais que sua
+    cota das vagas.
+    """
+
+    def __init__(self, max_concorrentes=3, envelhecimento=1.0, segundos_por_segundo=0.2, custo_fixo=1.5):
+        self.max_concorrentes = max_concorrentes
+        self.envelhecimento = envelhecimento
+        # EWMA do tempo de processamento por segundo de áudio (atualizada a cada conclusão)
+        self.segundos_por_segundo = segundos_por_segundo
+        self.custo_fixo = custo_fixo
+        self.fila = []
+        self.executando = []
+        self._contador = itertools.count()
+        self._avisos = set()
+
+    def estimar_custo(self, duracao, tamanho=None) -> float:
+        """Segundos de processamento esperados para o áudio."""
+        if not duracao and tamanho:
+            duracao = tamanho / _BYTES_POR_SEGUNDO
+        return self.custo_fixo + self.segundos_por_segundo * (duracao or 0)
+
+    def _cota(self, user_id) -> int:
+        usuarios = {t.user_id for t in self.fila} | {t.user_id for t in self.executando}
+        return max(1, self.max_concorrentes // max(1, len(usuarios)))
+
+    def _em_execucao(self, user_id) -> int:
+        return sum(1 for t in self.executando if t.user_id == user_id)
+
+    def _ordenar(self, agora):
+        """Fila na ordem de despacho: primeiro quem está dentro da cota, depois a prioridade."""
+        def chave(t):
+            acima_da_cota = self._em_execucao(t.user_id) >= self._cota(t.user_id)
+            return (acima_da_cota, t.custo - (agora - t.chegada) * self.envelhecimento, t.ordem)
+        self.fila.sort(key=chave)
+
+    def _despachar(self):
+        agora = time.monotonic()
+        while self.fila and len(self.executando) < self.max_concorrentes:
+            self._ordenar(agora)
+            tarefa = self.fila.pop(0)
+            tarefa.inicio = agora
+            self.executando.append(tarefa)
+            tarefa.liberada.set()
+        self._ordenar(agora)
+        self._avisar_posicoes(agora)
+
+    def _restante_em_execucao(self, agora) -> list:
+        return sorted(max(0.0, t.custo - (agora - t.inicio)) for t in self.executando)
+
+    def _avisar_posicoes(self, agora):
+        """Notifica (sem esperar) as tarefas cuja posição na fila mudou."""
+        vagas = self._restante_em_execucao(agora)
+        vagas += [0.0] * (self.max_concorrentes - len(vagas))
+        for posicao, tarefa in enumerate(self.fila, start=1):
+            # ETA: simula as vagas liberando na ordem da fila
+            inicio = min(vagas)
+            vagas[vagas.index(inicio)] = inicio + tarefa.custo
+            if tarefa.posicao != posicao and tarefa.ao_mudar:
+                aviso = asyncio.get_running_loop().create_task(self._avisar(tarefa, posicao, inicio))
+                self._avisos.add(aviso)
+                aviso.add_done_callback(self._avisos.discard)
+            tarefa.posicao = posicao
+
+    @staticmethod
+    async def _avisar(tarefa, posicao, eta):
+        # Pode ter sido liberada entre o agendamento e a execução do aviso
+        if not tarefa.liberada.is_set():
+            await tarefa.ao_mudar(posicao, eta)
+
+    def _concluir(self, tarefa, sucesso):
+        self.executando.remove(tarefa)
+        if sucesso and tarefa.duracao:
+            observado = (time.monotonic() - tarefa.inicio - self.custo_fixo) / tarefa.duracao
+            self.segundos_por_segundo += _ALFA_EWMA * (max(0.0, observado) - self.segundos_por_segundo)
+        self._despachar()
+
+    @asynccontextmanager
+    async def vaga(self, user_id, duracao, tamanho=None, ao_mudar=None):
+        """
+        Aguarda a vez do áudio e mantém a vaga durante o bloco.
+        `ao_mudar(posicao, eta_segundos)` é chamado (em background) enquanto
+        o áudio espera na fila.
+        """
+        tarefa = Tarefa(user_id, duracao, self.estimar_custo(duracao, tamanho),
+                        next(self._contador), ao_mudar)
+        self.fila.append(tarefa)
+        self._despachar()
+
+        try:
+            await tarefa.liberada.wait()
+        except asyncio.CancelledError:
+            if tarefa in self.fila:
+                self.fila.remove(tarefa)
+                self._despachar()
+            elif tarefa in self.executando:
+                # Cancelada no instante em que foi liberada: devolve a vaga
+                self._concluir(tarefa, False)
+            raise
+
+        espera = tarefa.inicio - tarefa.chegada
+        if espera >= 1:
+            logger.info("🚦 Áudio de %ss liberado após %.1f s na fila", duracao, espera)
+
+        sucesso = False
+        try:
+            yield tarefa
+            sucesso = True
+        finally:
+            self._concluir(tarefa, sucesso)
+
+    def metricas(self) -> dict:
+        return {
+            "na_fila": len(self.fila),
+            "executando": len(self.executando),
+            "segundos_por_segundo": round(self.segundos_por_segundo, 3),
+        }
@@ -0,0 +1,150 @@
+"""
+Extração estruturada de sinais vitais e doses medicamentosas
+"""
+
+import re
+import logging
+from duplicatas import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+# (?!\d): "glicemia 1200" não pode virar 120; 4 dígitos cobrem a faixa da glicemia
+_NUM = r"(\d{1,4}(?:[,.]\d)?)(?!\d)"
+
+# parâmetro → (padrões com o valor no grupo 1, unidade, faixa plausível)
+PARAMETROS_VITAIS = {
+    "FC": ([
+        r"\bFC\b\D{0,12}?" + _NUM,
+        r"frequ[eê]ncia\s+card[ií]aca\D{0,12}?" + _NUM,
+        _NUM + r"\s*bpm\b",
+    ], "bpm", (20, 300)),
+    "FR": ([
+        r"\bFR\b\D{0,12}?" + _NUM,
+        r"frequ[eê]ncia\s+respirat[oó]ria\D{0,12}?" + _NUM,
+        _NUM + r"\s*(?:irpm|ipm|rpm|incurs[oõ]es)\b",
+    ], "irpm", (5, 150)),
+    "SPO2": ([
+        r"(?:\bsat\b|satura[cç][aã]o|\bsp\s*o2\b)\D{0,12}?" + _NUM,
+    ], "%", (50, 100)),
+    "TEMP": ([
+        r"(?:\btemperatura\b|\btemp\b|\btax\b)\D{0,12}?" + _NUM,
+        _NUM + r"\s*(?:°\s*C|º\s*C|graus)",
+    ], "°C", (30, 45)),
+    "GLICEMIA": ([
+        r"(?:glicemia(?:\s+capilar)?|\bHGT\b|\bdextro\b)\D{0,12}?" + _NUM,
+    ], "mg/dL", (10, 1500)),
+    "ECG": ([
+        r"\bECG\b\D{0,8}?" + _NUM,
+    ], "pontos", (3, 15)),
+}
+
+_PADROES_VITAIS = {
+    parametro: [re.compile(p, re.IGNORECASE) for p in padroes]
+    for parametro, (padroes, _, _) in PARAMETROS_VITAIS.items()
+}
+
+MEDICAMENTOS = [
+    "soro antiescorpiônico", "ondansetrona", "dexametazona", "dexametasona",
+    "atropina", "insulina regular", "insulina", "salbutamol", "prometazina",
+    "diazepam", "midazolam", "fenobarbital", "amoxicilina", "dipirona",
+    "paracetamol", "ibuprofeno", "ceftriaxona", "prednisolona", "adrenalina",
+    "soro fisiológico",
+]
+
+# Massa por volume (mg/dL, mg/L, g/dL...) é resultado de exame, não dose
+_PADRAO_DOSE = re.compile(
+    r"(\d+(?:[,.]\d+)?)\s*(ml|mg|mcg|g|UI|unidades?|ampolas?|amp)\b(?!\s*/\s*(?:d?l|ml)\b)",
+    re.IGNORECASE
+)
+_UNIDADES = {"ui": "UI", "unidade": "unidades", "ampolas": "ampola", "amp": "ampola"}
+_NOMES_MEDICAMENTOS = "|".join(re.escape(m) for m in sorted(MEDICAMENTOS, key=len, reverse=True))
+_PADRAO_MEDICAMENTO = re.compile(_NOMES_MEDICAMENTOS, re.IGNORECASE)
+# "3 ampolas de soro antiescorpiônico": medicamento logo após a unidade
+_PADRAO_MEDICAMENTO_APOS = re.compile(
+    rf"\s+(?:(?:de|do|da)\s+)?({_NOMES_MEDICAMENTOS})\b", re.IGNORECASE
+)
+_JANELA_MEDICAMENTO = 40
+
+
+def normalizar_medicamento(nome: str) -> str:
+    """Nome em minúsculas, sem acentos (chave de busca)."""
+    return " ".join(normalizar_texto(nome))
+
+
+def _valor(texto: str) -> float:
+    return float(texto.replace(",", "."))
+
+
+def extrair_sinais_vitais(texto: str) -> list:
+    """Retorna [{parametro, valor, unidade, trecho, posicao}] dos sinais vitais citados."""
+    encontrados = []
+    posicoes = set()
+
+    for parametro, padroes in _PADROES_VITAIS.items():
+        _, unidade, (minimo, maximo) = PARAMETROS_VITAIS[parametro]
+        for padrao in padroes:
+            for match in padrao.finditer(texto):
+                # "FC 120 bpm" casa dois padrões no mesmo número
+                if (parametro, match.start(1)) in posicoes:
+                    continue
+                valor = _valor(match.group(1))
+                if not minimo <= valor <= maximo:
+                    continue
+                posicoes.add((parametro, match.start(1)))
+                encontrados.append({
+                    "parametro": parametro,
+                    "valor": valor,
+                    "unidade": unidade,
+                    "medicamento": None,
+                    "trecho": match.group(0).strip(),
+                    "posicao": match.start(1),
+                })
+
+    return encontrados
+
+
+def extrair_doses(texto: str, ignorar=()) -> list:
+    """
+    Retorna doses [{parametro: "DOSE", valor, unidade, medicamento, trecho}].
+    O medicamento é o conhecido logo após a unidade ("2 ampolas de adrenalina")
+    ou, se não houver, o conhecido mais próximo antes da dose sem outra dose
+    no meio. Doses sem medicamento conhecido não são gravadas.
+    `ignorar`: posições de números já extraídos como sinais vitais.
+    """
+    doses = []
+    fim_anterior = 0
+
+    for match in _PADRAO_DOSE.finditer(texto):
+        if match.start(1) in ignorar:
+            continue
+        inicio, fim = match.start(), match.end()
+        apos = _PADRAO_MEDICAMENTO_APOS.match(texto, fim)
+        if apos:
+            medicamento, fim = apos.group(1), apos.end()
+        else:
+            janela = texto[max(fim_anterior, inicio - _JANELA_MEDICAMENTO):inicio]
+            conhecidos = list(_PADRAO_MEDICAMENTO.finditer(janela))
+            medicamento = conhecidos[-1].group(0) if conhecidos else None
+            if medicamento:
+                inicio = inicio - len(janela) + conhecidos[-1].start()
+        fim_anterior = fim
+        if not medicamento:
+            continue
+
+        doses.append({
+            "parametro": "DOSE",
+            "valor": _valor(match.group(1)),
+            "unidade": _UNIDADES.get(match.group(2).lower(), match.group(2).lower()),
+            "medicamento": normalizar_medicamento(medicamento),
+            "trecho": texto[inicio:fim],
+        })
+
+    return doses
+
+
+def extrair_parametros(texto: str) -> list:
+    """Todos os parâmetros estruturados de uma transcrição."""
+    vitais = extrair_sinais_vitais(texto or "")
+    parametros = vitais + extrair_doses(texto or "", {v["posicao"] for v in vitais})
+    logger.debug("🩺 Parâmetros extraídos: %d", len(parametros))
+    return parametros
@@ -0,0 +1,63 @@
+"""
+Mensagem de status do processamento atualizada em background
+"""
+
+import asyncio
+import logging
+
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+class AtualizadorStatus:
+    """
+    Uma mensagem de status por áudio. `definir()` não espera o Telegram:
+    guarda o texto mais recente e uma tarefa em background envia/edita a
+    mensagem. Estados que chegam enquanto uma chamada está em andamento são
+    mesclados — só o último é enviado. `finalizar()` troca o status pelo
+    resultado com uma única edição.
+    """
+
+    def __init__(self, mensagem_origem):
+        self.origem = mensagem_origem
+        self.mensagem = None
+        self._pendente = None
+        self._enviado = None
+        self._tarefa = None
+
+    def definir(self, texto):
+        self._pendente = texto
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.get_running_loop().create_task(self._enviar_pendentes())
+
+    async def _enviar_pendentes(self):
+        while self._pendente is not None and self._pendente != self._enviado:
+            texto, self._pendente = self._pendente, None
+            try:
+                if self.mensagem is None:
+                    self.mensagem = await self.origem.reply_text(texto)
+                else:
+                    await self.mensagem.edit_text(texto)
+                self._enviado = texto
+            except BadRequest as e:
+                # "message is not modified" e afins não devem derrubar o processamento
+                logger.debug("Status não atualizado: %s", e)
+
+    async def finalizar(self, texto, **kwargs):
+        """Espera o envio em andamento e substitui o status pelo texto final."""
+        self._pendente = None
+        if self._tarefa is not None:
+            try:
+                await self._tarefa
+            except Exception as e:
+                logger.warning("⚠️ Falha ao atualizar status: %s", e)
+
+        if self.mensagem is None:
+            return await self.origem.reply_text(texto, **kwargs)
+        try:
+            return await self.mensagem.edit_text(texto, **kwargs)
+        except BadRequest as e:
+            # Status apagado ou não editável: responde normalmente
+            logger.debug("Status não editável (%s), respondendo", e)
+            return await self.origem.reply_text(texto, **kwargs)
@@ -0,0 +1,404 @@
+"""
+Migrações versionadas do schema SQLite (PRAGMA user_version)
+
+Dependências dos backfills: o SQL de cada um é fixo aqui, escrito para o
+schema da sua versão. Do código da aplicação só são importadas funções
+puras que calculam dados derivados (prévia, MinHash, parâmetros, nomes e
+tags normalizados), porque o valor gravado precisa bater com o que a
+aplicação atual calcula ao ler. Se uma delas mudar de resultado, os dados
+antigos ficam desatualizados: crie uma migração nova que os recalcule
+(como a 13 para as tags), sem alterar os backfills já publicados.
+"""
+
+import logging
+from renderizacao import renderizar
+import duplicatas
+from extracao import extrair_parametros
+from pacientes import normalizar_nome, trigramas
+from tags import normalizar_tag
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# BACKFILLS (passos Python das migrações)
+# ============================================
+
+def _backfill_renderizacao(cursor):
+    """Renderiza prévia e blocos das transcrições já existentes."""
+    linhas = cursor.execute("SELECT id, transcricao_formatada FROM transcricoes").fetchall()
+    cursor.executemany(
+        "UPDATE transcricoes SET preview_telegram = ?, blocos_telegram = ? WHERE id = ?",
+        [(*renderizar(texto), tid) for tid, texto in linhas]
+    )
+
+
+def _backfill_minhash(cursor):
+    """Calcula assinaturas MinHash e buckets LSH das transcrições existentes."""
+    linhas = cursor.execute("SELECT id, transcricao_formatada FROM transcricoes").fetchall()
+    for tid, texto in linhas:
+        assinatura = duplicatas.calcular_assinatura(texto)
+        cursor.execute(
+            "INSERT OR REPLACE INTO minhash_assinaturas (transcricao_id, assinatura) VALUES (?, ?)",
+            (tid, duplicatas.serializar(assinatura))
+        )
+        cursor.executemany(
+            "INSERT INTO lsh_buckets (banda, hash, transcricao_id) VALUES (?, ?, ?)",
+            [(banda, h, tid) for banda, h in enumerate(duplicatas.hashes_bandas(assinatura))]
+        )
+
+
+def _backfill_parametros(cursor):
+    """Extrai sinais vitais e doses das transcrições existentes."""
+    linhas = cursor.execute(
+        "SELECT id, telegram_user_id, transcricao_formatada FROM transcricoes"
+    ).fetchall()
+    for tid, user_id, texto in linhas:
+        cursor.executemany("""
+            INSERT INTO parametros_clinicos
+            (transcricao_id, telegram_user_id, parametro, valor, unidade, medicamento, trecho)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(tid, user_id, p["parametro"], p["valor"], p["unidade"], p["medicamento"], p["trecho"])
+              for p in extrair_parametros(texto)])
+
+
+def _backfill_pacientes(cursor):
+    """Cria pacientes a partir de paciente_nome já preenchido (schema da versão 7)."""
+    linhas = cursor.execute("""
+        SELECT id, telegram_user_id, paciente_nome FROM transcricoes
+        WHERE paciente_nome IS NOT NULL AND paciente_nome != ''
+    """).fetchall()
+    ids = {}
+    for tid, user_id, nome in linhas:
+        normalizado = normalizar_nome(nome)
+        if not normalizado:
+            continue
+        if (user_id, normalizado) not in ids:
+            grams = trigramas(nome)
+            cursor.execute("""
+                INSERT INTO pacientes (telegram_user_id, nome, nome_normalizado, num_trigramas)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, " ".join(nome.split()), normalizado, len(grams)))
+            paciente_id = ids[(user_id, normalizado)] = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO paciente_trigramas (trigrama, paciente_id) VALUES (?, ?)",
+                [(g, paciente_id) for g in grams]
+            )
+        cursor.execute("UPDATE transcricoes SET paciente_id = ? WHERE id = ?",
+                       (ids[(user_id, normalizado)], tid))
+
+
+def _backfill_tags(cursor):
+    """Normaliza tags existentes, preenche o dono e remove duplicatas."""
+    linhas = cursor.execute("SELECT id, tag FROM tags").fetchall()
+    cursor.executemany("UPDATE tags SET tag = ? WHERE id = ?",
+                       [(normalizar_tag(tag), tid) for tid, tag in linhas])
+    cursor.execute("""
+        UPDATE tags SET telegram_user_id = (
+            SELECT telegram_user_id FROM transcricoes WHERE transcricoes.id = tags.transcricao_id
+        )
+    """)
+    cursor.execute("""
+        DELETE FROM tags WHERE tag = '' OR id NOT IN (
+            SELECT MIN(id) FROM tags GROUP BY transcricao_id, tag
+        )
+    """)
+
+
+# ============================================
+# MIGRAÇÕES
+# ============================================
+
+# Cada migração: (versão, descrição, passos)
+# Um passo é um comando SQL (str) ou uma função que recebe o cursor (backfills).
+# Nunca alterar migrações já publicadas — sempre adicionar uma nova no final.
+MIGRACOES = [
+    (1, "Tabela de transcrições e índices básicos", [
+        """
+        CREATE TABLE IF NOT EXISTS transcricoes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_message_id INTEGER UNIQUE,
+            telegram_user_id INTEGER,
+            data_hora TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            audio_file_id TEXT,
+            audio_duracao INTEGER,
+            transcricao_raw TEXT,
+            transcricao_formatada TEXT,
+            tipo_documento TEXT,
+            categorias TEXT,
+            paciente_nome TEXT,
+            tags_adicionais TEXT,
+            editado BOOLEAN DEFAULT 0,
+            enviado_hf BOOLEAN DEFAULT 0,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_categorias ON transcricoes(categorias)",
+        "CREATE INDEX IF NOT EXISTS idx_data ON transcricoes(data_hora)",
+        "CREATE INDEX IF NOT EXISTS idx_tipo ON transcricoes(tipo_documento)",
+        "CREATE INDEX IF NOT EXISTS idx_user ON transcricoes(telegram_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_paciente ON transcricoes(paciente_nome)",
+    ]),
+    (2, "Tabela de tags com índices", [
+        """
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transcricao_id INTEGER,
+            tag TEXT,
+            data_criacao TEXT,
+            FOREIGN KEY (transcricao_id) REFERENCES transcricoes(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags(tag)",
+        "CREATE INDEX IF NOT EXISTS idx_tags_transcricao ON tags(transcricao_id)",
+    ]),
+    (3, "Fila de exportação (comando de voz 'enviar para HF')", [
+        """
+        CREATE TABLE IF NOT EXISTS fila_exportacao (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transcricao_id INTEGER NOT NULL,
+            destino TEXT NOT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processado BOOLEAN DEFAULT 0,
+            UNIQUE (transcricao_id, destino),
+            FOREIGN KEY (transcricao_id) REFERENCES transcricoes(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fila_pendentes ON fila_exportacao(processado, destino)",
+    ]),
+    (4, "Prévia e blocos do Telegram pré-renderizados", [
+        "ALTER TABLE transcricoes ADD COLUMN preview_telegram TEXT",
+        "ALTER TABLE transcricoes ADD COLUMN blocos_telegram TEXT",
+        _backfill_renderizacao,
+    ]),
+    (5, "MinHash/LSH para quase-duplicatas e vínculo entre versões", [
+        "ALTER TABLE transcricoes ADD COLUMN versao_de INTEGER",
+        """
+        CREATE TABLE IF NOT EXISTS minhash_assinaturas (
+            transcricao_id INTEGER PRIMARY KEY,
+            assinatura BLOB NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            banda INTEGER NOT NULL,
+            hash INTEGER NOT NULL,
+            transcricao_id INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_lsh_bucket ON lsh_buckets(banda, hash)",
+        "CREATE INDEX IF NOT EXISTS idx_lsh_transcricao ON lsh_buckets(transcricao_id)",
+        """
+        CREATE TABLE IF NOT EXISTS quase_duplicatas (
+            transcricao_id INTEGER PRIMARY KEY,
+            candidata_id INTEGER NOT NULL,
+            similaridade REAL NOT NULL
+        )
+        """,
+        _backfill_minhash,
+    ]),
+    (6, "Sinais vitais e doses extraídos em tabela numérica indexada", [
+        """
+        CREATE TABLE IF NOT EXISTS parametros_clinicos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transcricao_id INTEGER NOT NULL,
+            telegram_user_id INTEGER,
+            parametro TEXT NOT NULL,
+            valor REAL NOT NULL,
+            unidade TEXT,
+            medicamento TEXT,
+            trecho TEXT,
+            FOREIGN KEY (transcricao_id) REFERENCES transcricoes(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_param_valor ON parametros_clinicos(parametro, valor)",
+        "CREATE INDEX IF NOT EXISTS idx_param_medicamento ON parametros_clinicos(parametro, medicamento)",
+        "CREATE INDEX IF NOT EXISTS idx_param_transcricao ON parametros_clinicos(transcricao_id)",
+        _backfill_parametros,
+    ]),
+    (7, "Pacientes normalizados com índice de trigramas", [
+        """
+        CREATE TABLE IF NOT EXISTS pacientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_user_id INTEGER,
+            nome TEXT NOT NULL,
+            nome_normalizado TEXT NOT NULL,
+            num_trigramas INTEGER NOT NULL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (telegram_user_id, nome_normalizado)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS paciente_trigramas (
+            trigrama TEXT NOT NULL,
+            paciente_id INTEGER NOT NULL,
+            PRIMARY KEY (trigrama, paciente_id)
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE transcricoes ADD COLUMN paciente_id INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_paciente_id ON transcricoes(paciente_id, data_hora)",
+        _backfill_pacientes,
+    ]),
+    (8, "Tags normalizadas, únicas por transcrição e com contagem incremental", [
+        "ALTER TABLE tags ADD COLUMN telegram_user_id INTEGER",
+        _backfill_tags,
+        "DROP INDEX IF EXISTS idx_tags_tag",
+        "DROP INDEX IF EXISTS idx_tags_transcricao",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_tags_unica ON tags(transcricao_id, tag)",
+        "CREATE INDEX IF NOT EXISTS idx_tags_usuario_tag ON tags(telegram_user_id, tag)",
+        """
+        CREATE TABLE IF NOT EXISTS tag_contagens (
+            telegram_user_id INTEGER,
+            tag TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (telegram_user_id, tag)
+        )
+        """,
+        """
+        INSERT INTO tag_contagens (telegram_user_id, tag, total)
+        SELECT telegram_user_id, tag, COUNT(*) FROM tags GROUP BY telegram_user_id, tag
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tags_inserir AFTER INSERT ON tags
+        BEGIN
+            INSERT INTO tag_contagens (telegram_user_id, tag, total)
+            VALUES (NEW.telegram_user_id, NEW.tag, 1)
+            ON CONFLICT (telegram_user_id, tag) DO UPDATE SET total = total + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tags_excluir AFTER DELETE ON tags
+        BEGIN
+            UPDATE tag_contagens SET total = total - 1
+            WHERE telegram_user_id IS OLD.telegram_user_id AND tag = OLD.tag;
+            DELETE FROM tag_contagens
+            WHERE telegram_user_id IS OLD.telegram_user_id AND tag = OLD.tag AND total <= 0;
+        END
+        """,
+    ]),
+    (9, "Mapa de transcrições arquivadas em arquivos mensais", [
+        """
+        CREATE TABLE IF NOT EXISTS arquivo_mapa (
+            transcricao_id INTEGER PRIMARY KEY,
+            mes TEXT NOT NULL,
+            telegram_user_id INTEGER,
+            paciente_id INTEGER
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_arquivo_mes ON arquivo_mapa(mes)",
+        "CREATE INDEX IF NOT EXISTS idx_arquivo_paciente ON arquivo_mapa(paciente_id, telegram_user_id)",
+        """
+        CREATE TABLE IF NOT EXISTS arquivo_meses (
+            mes TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+    ]),
+    (10, "Mensagens de origem de cada transcrição (rajadas de áudios)", [
+        """
+        CREATE TABLE IF NOT EXISTS transcricao_mensagens (
+            transcricao_id INTEGER NOT NULL,
+            parte INTEGER NOT NULL,
+            telegram_message_id INTEGER NOT NULL,
+            audio_file_id TEXT,
+            PRIMARY KEY (transcricao_id, parte)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_mensagens_origem ON transcricao_mensagens(telegram_message_id)",
+        """
+        INSERT OR IGNORE INTO transcricao_mensagens (transcricao_id, parte, telegram_message_id, audio_file_id)
+        SELECT id, 0, telegram_message_id, audio_file_id
+        FROM transcricoes
+        WHERE telegram_message_id IS NOT NULL
+        """,
+    ]),
+    (11, "Agregados incrementais e snapshots de relatórios", [
+        """
+        CREATE TABLE IF NOT EXISTS relatorio_agregados (
+            telegram_user_id INTEGER NOT NULL,
+            dia TEXT NOT NULL,
+            dimensao TEXT NOT NULL,
+            chave TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            soma_duracao INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (telegram_user_id, dia, dimensao, chave)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS relatorio_estado (
+            chave TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS relatorio_snapshots (
+            telegram_user_id INTEGER NOT NULL,
+            periodo TEXT NOT NULL,
+            inicio TEXT NOT NULL,
+            fim TEXT NOT NULL,
+            dados TEXT NOT NULL,
+            grafico BLOB,
+            gerado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (telegram_user_id, periodo)
+        )
+        """,
+    ]),
+    (12, "Backend que produziu cada transcrição", [
+        "ALTER TABLE transcricoes ADD COLUMN backend_transcricao TEXT",
+    ]),
+    (13, "Tags sem crases (quebravam o Markdown das listagens)", [
+        "UPDATE OR IGNORE tags SET tag = replace(tag, '`', '') WHERE tag LIKE '%`%'",
+        # Sobram só as que já existiam sem crase na mesma transcrição
+        "DELETE FROM tags WHERE tag LIKE '%`%' OR tag = ''",
+        "DELETE FROM tag_contagens",
+        """
+        INSERT INTO tag_contagens (telegram_user_id, tag, total)
+        SELECT telegram_user_id, tag, COUNT(*) FROM tags GROUP BY telegram_user_id, tag
+        """,
+    ]),
+    (14, "Doses reextraídas com o medicamento citado após a unidade", [
+        # Só o banco quente: arquivos mensais mantêm os parâmetros já copiados
+        "DELETE FROM parametros_clinicos",
+        _backfill_parametros,
+    ]),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def versao_schema(conn) -> int:
+    """Retorna a versão atual do schema gravada no banco."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def aplicar_migracoes(conn) -> int:
+    """
+    Aplica migrações pendentes, em ordem, numa única transação.
+    Com o schema em dia, custa apenas a leitura do user_version.
+    Retorna a versão final do schema.
+    """
+    versao = versao_schema(conn)
+    if versao >= VERSAO_ATUAL:
+        return versao
+
+    pendentes = [m for m in MIGRACOES if m[0] > versao]
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        for numero, descricao, passos in pendentes:
+            for passo in passos:
+                if callable(passo):
+                    passo(cursor)
+                else:
+                    cursor.execute(passo)
+            logger.info(f"🔧 Migração {numero} aplicada: {descricao}")
+        # PRAGMA não aceita parâmetros; VERSAO_ATUAL é sempre int
+        cursor.execute(f"PRAGMA user_version = {int(VERSAO_ATUAL)}")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"❌ Erro ao migrar schema (v{versao}): {e}")
+        raise
+
+    logger.info(f"✅ Schema migrado: v{versao} → v{VERSAO_ATUAL}")
+    return VERSAO_ATUAL
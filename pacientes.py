@@ -0,0 +1,61 @@
+"""
+Normalização de nomes de pacientes, trigramas e extração do ditado
+"""
+
+import re
+from duplicatas import normalizar_texto
+
+# "Paciente João da Silva", "paciente de nome Maria Souza", "nome: Ana Lima"
+_PADRAO_NOME = re.compile(
+    r"(?i:paciente(?:\s+de\s+nome|\s+chamad[oa])?|nome\s*:)\s+"
+    r"([A-ZÀ-Ý][a-zà-ÿ]+(?:\s+(?:d[aeo]s?\s+)?[A-ZÀ-Ý][a-zà-ÿ]+){1,4})"
+)
+
+
+def normalizar_nome(nome: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples (chave única do paciente)."""
+    return " ".join(normalizar_texto(nome))
+
+
+def trigramas(nome: str) -> set:
+    """Trigramas de cada palavra do nome normalizado, com borda ("  jo", " jo", ...)."""
+    grams = set()
+    for palavra in normalizar_nome(nome).split():
+        palavra = f"  {palavra} "
+        grams.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+    return grams
+
+
+def extrair_nome_paciente(texto: str):
+    """Nome próprio ditado após "paciente"/"nome:" (pelo menos nome e sobrenome) ou None."""
+    match = _PADRAO_NOME.search(texto or "")
+    return match.group(1).strip() if match else None
+
+
+def registrar_paciente(cursor, user_id, nome):
+    """
+    Retorna o ID do paciente (do usuário) com esse nome, criando-o e
+    indexando seus trigramas se ainda não existir. Não faz commit.
+    """
+    normalizado = normalizar_nome(nome)
+    if not normalizado:
+        return None
+
+    existente = cursor.execute(
+        "SELECT id FROM pacientes WHERE telegram_user_id = ? AND nome_normalizado = ?",
+        (user_id, normalizado)
+    ).fetchone()
+    if existente:
+        return existente[0]
+
+    grams = trigramas(nome)
+    cursor.execute("""
+        INSERT INTO pacientes (telegram_user_id, nome, nome_normalizado, num_trigramas)
+        VALUES (?, ?, ?, ?)
+    """, (user_id, " ".join(nome.split()), normalizado, len(grams)))
+    paciente_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO paciente_trigramas (trigrama, paciente_id) VALUES (?, ?)",
+        [(g, paciente_id) for g in grams]
+    )
+    return paciente_id
@@ -17,9 +17,9 @@ def corrigir_termos_medicos(texto: str) -> str:
         try:
             texto_corrigido = re.sub(padrao, correcao, texto_corrigido, flags=re.IGNORECASE)
         except Exception as e:
-            logger.warning(f"⚠️  Erro ao aplicar correção '{padrao}': {e}")
+            logger.warning("⚠️  Erro ao aplicar correção '%s': %s", padrao, e)
 
-    logger.info("✅ Correções médicas aplicadas")
+    logger.debug("✅ Correções médicas aplicadas")
     return texto_corrigido
 
 
@@ -42,10 +42,22 @@ def normalizar_doses(texto: str) -> str:
     # Ex: "0,5unidade" → "0,5 unidade"
     texto = re.sub(r'(\d+)\s*(unidade|unidades)', r'\1 \2', texto)
 
-    logger.info("✅ Doses normalizadas")
+    logger.debug("✅ Doses normalizadas")
     return texto
 
 
+# Um único padrão com grupos nomeados: todos os comandos saem numa só varredura
+PADRAO_COMANDOS_VOZ = re.compile(
+    r"lince,?\s*(?:"
+    r"(?P<iniciar>iniciar\s*transcrição)"
+    r"|(?P<parar>parar\s*transcrição)"
+    r"|(?P<marcar>marcar\s*importante)"
+    r"|(?P<enviar_hf>enviar\s*para\s*hf)"
+    r")[.!]?",
+    re.IGNORECASE,
+)
+
+
 def extrair_comandos_voz(texto: str) -> tuple:
     """
     Extrai comandos de voz do tipo:
@@ -57,39 +69,49 @@ def extrair_comandos_voz(texto: str) -> tuple:
     Retorna: (texto_limpo, lista_de_comandos)
     """
     comandos = []
-
-    padroes = {
-        "iniciar": r"(?i)lince,?\s*iniciar\s*transcrição",
-        "parar": r"(?i)lince,?\s*parar\s*transcrição",
-        "marcar": r"(?i)lince,?\s*marcar\s*importante",
-        "enviar_hf": r"(?i)lince,?\s*enviar\s*para\s*hf",
-    }
-
-    texto_limpo = texto
-
-    for tipo, padrao in padroes.items():
-        matches = list(re.finditer(padrao, texto))
-        for match in matches:
-            comandos.append({
-                "tipo": tipo,
-                "texto": match.group(0),
-                "posicao": match.start()
-            })
-            texto_limpo = texto_limpo.replace(match.group(0), "")
+    partes = []
+    ultimo = 0
+
+    for match in PADRAO_COMANDOS_VOZ.finditer(texto):
+        comandos.append({
+            "tipo": match.lastgroup,
+            "texto": match.group(0),
+            "posicao": match.start(),
+            "fim": match.end(),
+        })
+        partes.append(texto[ultimo:match.start()])
+        ultimo = match.end()
+
+    partes.append(texto[ultimo:])
+    texto_limpo = "".join(partes)
 
     # Limpar espaços extras
     texto_limpo = re.sub(r'\n\s*\n', '\n\n', texto_limpo)
     texto_limpo = texto_limpo.strip()
 
-    logger.info(f"✅ Comandos extraídos: {len(comandos)}")
+    logger.debug("✅ Comandos extraídos: %d", len(comandos))
     return texto_limpo, comandos
 
 
+def recortar_trecho_comandos(texto: str, comandos: list) -> str:
+    """
+    Recorta o texto original ao trecho entre "iniciar" e "parar transcrição".
+    Sem "iniciar", vale o início do texto; sem "parar", vale o fim.
+    Retorna o trecho já sem os comandos de voz.
+    """
+    inicio = next((c["fim"] for c in comandos if c["tipo"] == "iniciar"), 0)
+    fim = next((c["posicao"] for c in comandos
+                if c["tipo"] == "parar" and c["posicao"] >= inicio), len(texto))
+
+    trecho, _ = extrair_comandos_voz(texto[inicio:fim])
+    return trecho
+
+
 def aplicar_pós_processamento(texto: str) -> str:
     """Aplica todos os pós-processamentos em sequência."""
     texto = corrigir_termos_medicos(texto)
     texto = segmentar_linhas(texto)
     texto = normalizar_doses(texto)
 
-    logger.info("✅ Pós-processamento completo")
+    logger.debug("✅ Pós-processamento completo")
     return texto
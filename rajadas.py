@@ -0,0 +1,58 @@
+"""
+Agrupamento de áudios enviados em sequência (rajada) num único documento
+"""
+
+import asyncio
+import time
+
+
+class Rajada:
+    __slots__ = ("partes", "ultima", "fechada", "status")
+
+    def __init__(self, status=None):
+        self.partes = []
+        self.ultima = time.monotonic()
+        self.fechada = False
+        self.status = status
+
+
+class AgrupadorRajadas:
+    """
+    Uma rajada aberta por usuário. Cada áudio que chega em até `janela`
+    segundos do anterior entra na mesma rajada; ela fecha quando a janela
+    passa sem novos áudios ou ao atingir `max_partes`.
+    """
+
+    def __init__(self, janela, max_partes):
+        self.janela = janela
+        self.max_partes = max_partes
+        self.abertas = {}
+
+    def adicionar(self, chave, parte, status=None):
+        """Adiciona a parte; retorna (rajada, primeira) — quem recebe primeira=True fecha a rajada."""
+        rajada = self.abertas.get(chave)
+        primeira = rajada is None
+        if primeira:
+            rajada = Rajada(status)
+            if self.janela > 0:
+                self.abertas[chave] = rajada
+        rajada.partes.append(parte)
+        rajada.ultima = time.monotonic()
+        if len(rajada.partes) >= self.max_partes:
+            self._fechar(chave, rajada)
+        return rajada, primeira
+
+    def _fechar(self, chave, rajada):
+        rajada.fechada = True
+        if self.abertas.get(chave) is rajada:
+            del self.abertas[chave]
+
+    async def aguardar_fechamento(self, chave, rajada) -> list:
+        """Espera a janela expirar (reiniciada a cada nova parte) e retorna as partes."""
+        while not rajada.fechada:
+            restante = rajada.ultima + self.janela - time.monotonic()
+            if restante <= 0:
+                self._fechar(chave, rajada)
+                break
+            await asyncio.sleep(restante)
+        return rajada.partes
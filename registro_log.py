@@ -0,0 +1,118 @@
+"""
+Logging estruturado (JSON) fora do event loop: QueueHandler + QueueListener
+"""
+
+import atexit
+import json
+import logging
+import queue
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+# ID do áudio em processamento; tarefas criadas durante o processamento herdam o valor
+id_correlacao: ContextVar[str] = ContextVar("id_correlacao", default="-")
+
+_CAMPOS_EXTRAS = ("etapa", "duracao_ms")
+
+
+class FiltroCorrelacao(logging.Filter):
+    """
+    Anexa o ID de correlação ao registro e amostra as linhas INFO/DEBUG por
+    áudio: 1 a cada N áudios mantém o rastro completo (decisão estável pelo ID),
+    os demais só registram avisos, erros e linhas marcadas com extra={"sempre": True}.
+    """
+
+    def __init__(self, amostragem=1):
+        super().__init__()
+        self.amostragem = max(1, amostragem)
+
+    def filter(self, record):
+        correlacao = id_correlacao.get()
+        record.correlacao = correlacao
+        if (correlacao == "-" or self.amostragem == 1 or record.levelno >= logging.WARNING
+                or getattr(record, "sempre", False)):
+            return True
+        return zlib.crc32(correlacao.encode()) % self.amostragem == 0
+
+
+class FormatadorJSON(logging.Formatter):
+    """Uma linha JSON por registro."""
+
+    def format(self, record):
+        dados = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "nivel": record.levelname,
+            "modulo": record.name,
+            "msg": record.getMessage(),
+            "correlacao": getattr(record, "correlacao", "-"),
+        }
+        for campo in _CAMPOS_EXTRAS:
+            if hasattr(record, campo):
+                dados[campo] = getattr(record, campo)
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False)
+
+
+class FilaHandler(QueueHandler):
+    """
+    QueueHandler que não formata nada na thread de quem loga: o prepare()
+    padrão monta a mensagem e o traceback aqui e descarta exc_info. Fila em
+    memória (sem pickle), então o registro pode seguir como está.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configurar_logs(arquivo, nivel="INFO", max_bytes=5 * 1024 * 1024, backups=5, amostragem=1):
+    """
+    Direciona todo o logging para uma fila; a escrita em arquivo (JSON, com
+    rotação por tamanho) e no console acontece na thread do QueueListener.
+    Retorna o listener (parado automaticamente na saída).
+    """
+    Path(arquivo).parent.mkdir(parents=True, exist_ok=True)
+
+    arquivo_handler = RotatingFileHandler(arquivo, maxBytes=max_bytes, backupCount=backups,
+                                          encoding="utf-8")
+    arquivo_handler.setFormatter(FormatadorJSON())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        "%(asctime)s - %(levelname)s - [%(correlacao)s] %(message)s"
+    ))
+
+    fila = queue.SimpleQueue()
+    fila_handler = FilaHandler(fila)
+    # Filtro no handler da fila: linhas descartadas nem chegam a ser formatadas
+    fila_handler.addFilter(FiltroCorrelacao(amostragem))
+
+    raiz = logging.getLogger()
+    raiz.handlers = [fila_handler]
+    raiz.setLevel(nivel)
+
+    listener = QueueListener(fila, arquivo_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(_parar, listener)
+    return listener
+
+
+def _parar(listener):
+    # QueueListener.stop() falha se chamado duas vezes
+    if listener._thread is not None:
+        listener.stop()
+
+
+@contextmanager
+def etapa(logger, nome, **extra):
+    """Mede a duração de uma etapa e registra etapa/duracao_ms como campos do JSON."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = (time.perf_counter() - inicio) * 1000
+        logger.info("⏱️ %s: %.1f ms", nome, duracao,
+                    extra={"etapa": nome, "duracao_ms": round(duracao, 1), **extra})
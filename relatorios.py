@@ -0,0 +1,84 @@
+"""
+Relatórios semanais/mensais: períodos, texto e gráfico de horários (PNG)
+"""
+
+import struct
+import zlib
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from config import RELATORIOS
+from renderizacao import escapar_markdown
+
+PERIODOS = ("semanal", "mensal")
+
+
+def intervalo(periodo: str, hoje: date = None) -> tuple:
+    """
+    Dias [inicio, fim) em ISO do último período completo: a semana ISO
+    (segunda a domingo) ou o mês civil anterior a `hoje`, no fuso dos relatórios.
+    """
+    hoje = hoje or datetime.now(RELATORIOS["fuso"]).date()
+    if periodo == "semanal":
+        fim = hoje - timedelta(days=hoje.weekday())
+        return (fim - timedelta(days=7)).isoformat(), fim.isoformat()
+    fim = hoje.replace(day=1)
+    return (fim - timedelta(days=1)).replace(day=1).isoformat(), fim.isoformat()
+
+
+def formatar_relatorio(periodo: str, dados: dict) -> str:
+    """Texto Markdown curto (cabe na legenda de uma foto)."""
+    fim = date.fromisoformat(dados["fim"]) - timedelta(days=1)
+    texto = (
+        f"📊 *Relatório {periodo}* ({dados['inicio']} a {fim.isoformat()})\n\n"
+        f"📝 Transcrições: {dados['total']}\n"
+        f"⏱️ Duração média: {dados['duracao_media']:.0f}s\n"
+    )
+    if dados["total"]:
+        pico = max(range(24), key=lambda h: dados["horas"][h])
+        texto += f"🕐 Horário de pico: {pico:02d}h ({dados['horas'][pico]})\n"
+
+    if dados["tipos"]:
+        texto += "\n*Tipos*\n" + "".join(
+            f"• {escapar_markdown(tipo)}: {total}\n" for tipo, total in dados["tipos"][:5]
+        )
+    if dados["categorias"]:
+        texto += "\n*Categorias*\n" + "".join(
+            f"• {escapar_markdown(cat)}: {total}\n" for cat, total in dados["categorias"][:8]
+        )
+    return texto
+
+
+def _png(imagem: np.ndarray) -> bytes:
+    """Codifica uma imagem RGB (altura × largura × 3, uint8) como PNG."""
+    altura, largura, _ = imagem.shape
+    # Cada linha começa com o byte de filtro 0 (nenhum)
+    bruto = np.hstack([np.zeros((altura, 1), np.uint8), imagem.reshape(altura, -1)]).tobytes()
+
+    def bloco(tipo, dados):
+        return (struct.pack(">I", len(dados)) + tipo + dados
+                + struct.pack(">I", zlib.crc32(tipo + dados) & 0xFFFFFFFF))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + bloco(b"IHDR", struct.pack(">IIBBBBB", largura, altura, 8, 2, 0, 0, 0))
+            + bloco(b"IDAT", zlib.compress(bruto, 9))
+            + bloco(b"IEND", b""))
+
+
+def grafico_horas_png(horas: list, largura_barra=16, altura=160, margem=8) -> bytes:
+    """Gráfico de barras das transcrições por hora do dia (0h–23h)."""
+    largura = margem * 2 + largura_barra * 24
+    imagem = np.full((altura, largura, 3), 255, np.uint8)
+    maximo = max(horas) or 1
+    base = altura - margem
+
+    for hora, total in enumerate(horas):
+        x = margem + hora * largura_barra
+        topo = base - int(total / maximo * (altura - 2 * margem))
+        imagem[topo:base, x + 2:x + largura_barra - 2] = (46, 125, 196)
+        # Marca a cada 6 horas no eixo
+        if hora % 6 == 0:
+            imagem[base:base + margem // 2, x:x + 1] = (120, 120, 120)
+    imagem[base:base + 1, margem:largura - margem] = (120, 120, 120)
+    return _png(imagem)
@@ -0,0 +1,69 @@
+"""
+Renderização para o Telegram (Markdown legado): escape, prévias e blocos
+"""
+
+import re
+import json
+
+# Limite do Telegram é 4096; sobra espaço para o cabeçalho da mensagem
+TAMANHO_BLOCO = 3800
+TAMANHO_PREVIEW = 75
+
+_ESPECIAIS_MARKDOWN = re.compile(r'([_*`\[])')
+
+
+def escapar_markdown(texto: str) -> str:
+    """Escapa caracteres especiais do parse_mode="Markdown"."""
+    return _ESPECIAIS_MARKDOWN.sub(r'\\\1', texto or "")
+
+
+def gerar_preview(texto: str, tamanho: int = TAMANHO_PREVIEW) -> str:
+    """Prévia de uma linha, já escapada, para listagens."""
+    preview = " ".join((texto or "")[:tamanho].split())
+    return escapar_markdown(preview) + "..."
+
+
+def _quebrar_linha_longa(linha: str, limite: int) -> list:
+    """Quebra uma linha sem \\n em pedaços que, escapados, cabem no limite."""
+    pedacos = []
+    atual = []
+    tamanho = 0
+    for caractere in linha:
+        escapado = escapar_markdown(caractere)
+        if tamanho + len(escapado) > limite:
+            pedacos.append("".join(atual))
+            atual, tamanho = [], 0
+        atual.append(escapado)
+        tamanho += len(escapado)
+    if atual:
+        pedacos.append("".join(atual))
+    return pedacos
+
+
+def dividir_em_blocos(texto: str, limite: int = TAMANHO_BLOCO) -> list:
+    """
+    Divide o texto completo em blocos escapados de até `limite` caracteres,
+    preferindo quebrar entre linhas.
+    """
+    blocos = []
+    atual = ""
+
+    for linha in (texto or "").split("\n"):
+        escapada = escapar_markdown(linha)
+        partes = [escapada] if len(escapada) <= limite else _quebrar_linha_longa(linha, limite)
+        for parte in partes:
+            candidato = f"{atual}\n{parte}" if atual else parte
+            if len(candidato) <= limite:
+                atual = candidato
+            else:
+                blocos.append(atual)
+                atual = parte
+
+    if atual or not blocos:
+        blocos.append(atual)
+    return blocos
+
+
+def renderizar(texto: str) -> tuple:
+    """Retorna (preview, blocos_json) prontos para gravar no banco."""
+    return gerar_preview(texto), json.dumps(dividir_em_blocos(texto), ensure_ascii=False)
@@ -0,0 +1,278 @@
+"""
+Índice TF-IDF em disco (NumPy memmap) para busca de casos similares
+"""
+
+import os
+import json
+import logging
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from duplicatas import normalizar_texto
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "com", "sem", "para", "por", "que", "dos", "das", "nos", "nas", "uma", "uns",
+    "umas", "ao", "aos", "pela", "pelo", "pelas", "pelos", "como", "mais", "mas",
+    "foi", "ser", "esta", "este", "essa", "esse", "isso", "tem", "ter", "sua",
+    "seu", "suas", "seus", "ele", "ela", "nao", "sim", "muito", "bem", "entao",
+}
+
+# Arquivos do índice (append-only, formato COO):
+#   linhas/termos/pesos:   uma entrada por termo não nulo de cada documento
+#   docs/usuarios/normas:  uma entrada por documento (ID da transcrição, dono e
+#                          norma TF-IDF calculada com o IDF do momento da inclusão)
+#   df:                    frequência de documento por termo (DIMENSAO posições)
+# Segmento por termo (segmento.json + segmento_<geração>_*.npy): as primeiras
+# "entradas" do COO reordenadas por termo, com ponteiros de início de cada termo.
+# A consulta lê só as listas dos seus termos no segmento e varre a cauda recente.
+_ARQUIVOS = {
+    "linhas": np.int32,
+    "termos": np.int32,
+    "pesos": np.float32,
+    "docs": np.int64,
+    "usuarios": np.int64,
+    "normas": np.float32,
+}
+
+
+def vetorizar(texto: str, dimensao: int) -> tuple:
+    """Termos (hash) e pesos TF sublineares (1 + log tf) de um texto."""
+    palavras = [p for p in normalizar_texto(texto)
+                if len(p) >= 3 and p not in STOPWORDS]
+    contagem = Counter(zlib.crc32(p.encode("utf-8")) % dimensao for p in palavras)
+    if not contagem:
+        return np.empty(0, np.int32), np.empty(0, np.float32)
+    termos = np.fromiter(contagem.keys(), np.int32, len(contagem))
+    tf = np.fromiter(contagem.values(), np.float32, len(contagem))
+    return termos, (1 + np.log(tf)).astype(np.float32)
+
+
+def _idf(df, n_docs) -> np.ndarray:
+    return (np.log((1 + n_docs) / (1 + df.astype(np.float32))) + 1).astype(np.float32)
+
+
+class IndiceSimilares:
+    def __init__(self, diretorio, dimensao, cauda_maxima=200_000):
+        self.diretorio = diretorio
+        self.dimensao = dimensao
+        self.cauda_maxima = cauda_maxima
+        self._lock_segmento = threading.Lock()
+        self._meta_segmento = os.path.join(diretorio, "segmento.json")
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, nome):
+        return os.path.join(self.diretorio, f"{nome}.bin")
+
+    def _ler(self, nome, dtype, modo="r"):
+        """Abre o arquivo como memmap (vazio se ainda não existir)."""
+        caminho = self._caminho(nome)
+        if not os.path.exists(caminho) or os.path.getsize(caminho) == 0:
+            return np.empty(0, dtype)
+        return np.memmap(caminho, dtype=dtype, mode=modo)
+
+    def _df(self, modo="r"):
+        caminho = self._caminho("df")
+        if not os.path.exists(caminho):
+            np.zeros(self.dimensao, np.int32).tofile(caminho)
+        return np.memmap(caminho, dtype=np.int32, mode=modo, shape=(self.dimensao,))
+
+    def total_documentos(self) -> int:
+        return len(self._ler("docs", np.int64))
+
+    def consistente(self) -> bool:
+        """Confere se os arquivos têm tamanhos compatíveis (ex.: após queda)."""
+        linhas = self._ler("linhas", np.int32)
+        n_docs = self.total_documentos()
+        return (
+            len(linhas) == len(self._ler("termos", np.int32)) == len(self._ler("pesos", np.float32))
+            and n_docs == len(self._ler("usuarios", np.int64)) == len(self._ler("normas", np.float32))
+            and (len(linhas) == 0 or int(linhas[-1]) < n_docs)
+            and self._segmento()[0] <= len(linhas)
+        )
+
+    def _segmento(self):
+        """(entradas cobertas, ptr, linhas, pesos) do segmento por termo atual."""
+        if not os.path.exists(self._meta_segmento):
+            return 0, None, None, None
+        with open(self._meta_segmento) as f:
+            meta = json.load(f)
+        base = os.path.join(self.diretorio, f"segmento_{meta['geracao']}")
+        return (meta["entradas"],
+                np.load(f"{base}_ptr.npy", mmap_mode="r"),
+                np.load(f"{base}_linhas.npy", mmap_mode="r"),
+                np.load(f"{base}_pesos.npy", mmap_mode="r"))
+
+    def precisa_compactar(self) -> bool:
+        return len(self._ler("linhas", np.int32)) - self._segmento()[0] > self.cauda_maxima
+
+    def compactar(self):
+        """
+        Regrava o segmento por termo com todas as entradas atuais. Pode rodar
+        numa thread enquanto documentos são acrescentados: cobre só as entradas
+        de documentos completos e troca o segmento atomicamente (segmento.json).
+        A geração anterior só é apagada na compactação seguinte, para consultas
+        que ainda a estejam lendo.
+        """
+        with self._lock_segmento:
+            linhas = np.array(self._ler("linhas", np.int32))
+            entradas = len(linhas)
+            termos = np.array(self._ler("termos", np.int32)[:entradas])
+            pesos = np.array(self._ler("pesos", np.float32)[:entradas])
+
+            ordem = np.argsort(termos, kind="stable")
+            ptr = np.zeros(self.dimensao + 1, np.int64)
+            ptr[1:] = np.cumsum(np.bincount(termos, minlength=self.dimensao))
+
+            anterior = None
+            if os.path.exists(self._meta_segmento):
+                with open(self._meta_segmento) as f:
+                    anterior = json.load(f)["geracao"]
+            geracao = (anterior or 0) + 1
+
+            base = os.path.join(self.diretorio, f"segmento_{geracao}")
+            np.save(f"{base}_ptr.npy", ptr)
+            np.save(f"{base}_linhas.npy", linhas[ordem])
+            np.save(f"{base}_pesos.npy", pesos[ordem])
+            with open(self._meta_segmento + ".tmp", "w") as f:
+                json.dump({"geracao": geracao, "entradas": entradas}, f)
+            os.replace(self._meta_segmento + ".tmp", self._meta_segmento)
+
+            # Remove gerações mais antigas que a anterior
+            for nome in os.listdir(self.diretorio):
+                if nome.startswith("segmento_") and nome.endswith(".npy"):
+                    g = int(nome.split("_")[1])
+                    if g < (anterior or geracao):
+                        os.remove(os.path.join(self.diretorio, nome))
+            logger.info(f"🗂️ Segmento de similares compactado ({entradas} entradas)")
+
+    def adicionar(self, transcricao_id, user_id, texto):
+        """Acrescenta um documento ao índice (atualização incremental)."""
+        termos, pesos = vetorizar(texto, self.dimensao)
+        linha = self.total_documentos()
+
+        df = self._df("r+")
+        if len(termos):
+            df[termos] += 1
+            df.flush()
+        norma = np.linalg.norm(pesos * _idf(df[termos], linha + 1))
+
+        # Termos antes do documento: uma queda no meio deixa o índice inconsistente
+        # (detectado em consistente()) em vez de um documento apontando para o nada.
+        # "docs" por último: consultas concorrentes só enxergam documentos completos
+        with open(self._caminho("termos"), "ab") as f:
+            termos.tofile(f)
+        with open(self._caminho("pesos"), "ab") as f:
+            pesos.tofile(f)
+        with open(self._caminho("linhas"), "ab") as f:
+            np.full(len(termos), linha, np.int32).tofile(f)
+        with open(self._caminho("normas"), "ab") as f:
+            np.array([norma], np.float32).tofile(f)
+        with open(self._caminho("usuarios"), "ab") as f:
+            np.array([user_id], np.int64).tofile(f)
+        with open(self._caminho("docs"), "ab") as f:
+            np.array([transcricao_id], np.int64).tofile(f)
+
+    def reconstruir(self, registros):
+        """Recria o índice do zero a partir de (id, user_id, texto), gravando tudo de uma vez."""
+        colunas = {nome: [] for nome in _ARQUIVOS}
+        df = np.zeros(self.dimensao, np.int32)
+
+        for linha, (transcricao_id, user_id, texto) in enumerate(registros):
+            termos, pesos = vetorizar(texto or "", self.dimensao)
+            colunas["termos"].append(termos)
+            colunas["pesos"].append(pesos)
+            colunas["linhas"].append(np.full(len(termos), linha, np.int32))
+            colunas["docs"].append(np.array([transcricao_id], np.int64))
+            colunas["usuarios"].append(np.array([user_id], np.int64))
+            df[termos] += 1
+
+        total = len(colunas["docs"])
+        idf = _idf(df, total)
+        colunas["normas"] = [np.array([np.linalg.norm(p * idf[t])], np.float32)
+                             for t, p in zip(colunas["termos"], colunas["pesos"])]
+
+        for nome, dtype in _ARQUIVOS.items():
+            dados = np.concatenate(colunas[nome]) if colunas[nome] else np.empty(0, dtype)
+            dados.astype(dtype).tofile(self._caminho(nome))
+        df.tofile(self._caminho("df"))
+        self.compactar()
+
+        logger.info(f"✅ Índice de similares reconstruído ({total} documentos)")
+        return total
+
+    def vizinhos(self, texto, user_id, k=5, excluir_id=None) -> list:
+        """
+        Top-k transcrições do usuário por similaridade de cosseno TF-IDF.
+        Lê só as listas dos termos da consulta (segmento + cauda recente) e
+        filtra pelo usuário antes de somar; a norma de cada documento é a
+        gravada na inclusão. Bloqueante: chamar via asyncio.to_thread.
+        Retorna lista de (transcricao_id, score).
+        """
+        docs = self._ler("docs", np.int64)
+        n_docs = len(docs)
+        if n_docs == 0:
+            return []
+
+        termos_q, pesos_q = vetorizar(texto, self.dimensao)
+        if len(termos_q) == 0:
+            return []
+
+        idf_q = _idf(self._df()[termos_q], n_docs)
+        norma_q = np.linalg.norm(pesos_q * idf_q)
+        # Contribuição de cada termo: peso no documento × idf × (peso na consulta × idf)
+        fatores = dict(zip(termos_q.tolist(), (pesos_q * idf_q * idf_q).tolist()))
+
+        # Segmento por termo: fatias contíguas, uma por termo da consulta
+        entradas, ptr, seg_linhas, seg_pesos = self._segmento()
+        partes_linhas, partes_contrib = [], []
+        if ptr is not None:
+            for termo, fator in fatores.items():
+                inicio, fim = int(ptr[termo]), int(ptr[termo + 1])
+                if fim > inicio:
+                    partes_linhas.append(np.asarray(seg_linhas[inicio:fim]))
+                    partes_contrib.append(np.asarray(seg_pesos[inicio:fim]) * fator)
+
+        # Cauda: entradas acrescentadas depois da última compactação
+        cauda_termos = self._ler("termos", np.int32)[entradas:]
+        cauda_linhas = self._ler("linhas", np.int32)[entradas:]
+        n = min(len(cauda_termos), len(cauda_linhas))
+        if n:
+            cauda_termos = np.asarray(cauda_termos[:n])
+            encontrados = np.flatnonzero(np.isin(cauda_termos, termos_q))
+            if len(encontrados):
+                termos_c = cauda_termos[encontrados]
+                pesos_c = np.asarray(self._ler("pesos", np.float32)[entradas:entradas + n])[encontrados]
+                fator = np.array([fatores[t] for t in termos_c.tolist()], np.float32)
+                partes_linhas.append(np.asarray(cauda_linhas[:n])[encontrados])
+                partes_contrib.append(pesos_c * fator)
+
+        if not partes_linhas:
+            return []
+        linhas = np.concatenate(partes_linhas)
+        contrib = np.concatenate(partes_contrib)
+
+        # Filtro de usuário (e documentos completos) antes de somar
+        validas = linhas < n_docs
+        linhas, contrib = linhas[validas], contrib[validas]
+        usuarios = self._ler("usuarios", np.int64)
+        manter = np.asarray(usuarios[linhas]) == user_id
+        if excluir_id is not None:
+            manter &= np.asarray(docs[linhas]) != excluir_id
+        linhas, contrib = linhas[manter], contrib[manter]
+        if len(linhas) == 0:
+            return []
+
+        candidatos, posicao = np.unique(linhas, return_inverse=True)
+        produtos = np.bincount(posicao, weights=contrib)
+        normas = np.asarray(self._ler("normas", np.float32)[candidatos])
+        scores = produtos / (normas * norma_q + 1e-9)
+
+        k = min(k, len(candidatos))
+        melhores = np.argpartition(-scores, k - 1)[:k]
+        melhores = melhores[np.argsort(-scores[melhores])]
+        return [(int(docs[candidatos[i]]), float(scores[i])) for i in melhores if scores[i] > 0]
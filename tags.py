@@ -0,0 +1,70 @@
+"""
+Normalização de tags e trie de prefixos para autocompletar
+"""
+
+import re
+
+
+def normalizar_tag(tag: str) -> str:
+    """Minúsculas, sem '#' inicial nem crases (quebrariam o Markdown), espaços viram '_'."""
+    tag = (tag or "").replace("`", "").strip().lstrip("#").lower()
+    return re.sub(r"\s+", "_", tag)
+
+
+class _No:
+    __slots__ = ("filhos", "total")
+
+    def __init__(self):
+        self.filhos = {}
+        self.total = 0  # > 0 quando uma tag termina neste nó
+
+
+class TrieTags:
+    """Uma trie por usuário; cada tag guarda sua contagem para ordenar sugestões."""
+
+    def __init__(self):
+        self.raizes = {}
+
+    def _raiz(self, user_id):
+        return self.raizes.setdefault(user_id, _No())
+
+    def _no(self, user_id, prefixo):
+        no = self.raizes.get(user_id)
+        for caractere in prefixo:
+            if no is None:
+                return None
+            no = no.filhos.get(caractere)
+        return no
+
+    def adicionar(self, user_id, tag, quantidade=1):
+        no = self._raiz(user_id)
+        for caractere in tag:
+            no = no.filhos.setdefault(caractere, _No())
+        no.total += quantidade
+
+    def existe(self, user_id, tag) -> bool:
+        no = self._no(user_id, tag)
+        return bool(no and no.total > 0)
+
+    def sugerir(self, user_id, prefixo, limite=5) -> list:
+        """Tags que começam com o prefixo, mais usadas primeiro: [(tag, total)]."""
+        inicio = self._no(user_id, prefixo)
+        if inicio is None:
+            return []
+
+        encontradas = []
+        pilha = [(inicio, prefixo)]
+        while pilha:
+            no, tag = pilha.pop()
+            if no.total > 0:
+                encontradas.append((tag, no.total))
+            pilha.extend((filho, tag + c) for c, filho in no.filhos.items())
+
+        encontradas.sort(key=lambda t: (-t[1], t[0]))
+        return encontradas[:limite]
+
+    def carregar(self, contagens):
+        """Recarrega a partir de (user_id, tag, total)."""
+        self.raizes = {}
+        for user_id, tag, total in contagens:
+            self.adicionar(user_id, tag, total)
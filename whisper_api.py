@@ -1,46 +1,233 @@
 import os
+import time
 import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import requests
-from config import GROQ_API_KEY, PROMPT_MEDICO_PEDIATRICO
+from config import PROMPT_MEDICO_PEDIATRICO
 
 logger = logging.getLogger(__name__)
 
-def transcrever_audio_groq(audio_file_path):
-    """Transcreve áudio usando Groq Whisper API via REST"""
+_ALFA_EWMA = 0.3
+_PESO_ERRO = 5.0
+_QUOTA_MINIMA = 0.05
+# Backend que só falhou até agora (sem latência medida) entra com esta latência
+_LATENCIA_DESCONHECIDA = 30.0
+# Meia-vida do peso dos erros: backend que falhou volta a ser tentado aos poucos
+_MEIA_VIDA_ERRO = 300.0
+
+# tipo → classe do backend (ver registrar_backend)
+REGISTRO_BACKENDS = {}
+
+
+def registrar_backend(tipo):
+    """Decorador: torna a classe disponível para o "tipo" na configuração."""
+    def decorar(classe):
+        REGISTRO_BACKENDS[tipo] = classe
+        return classe
+    return decorar
+
+
+def segundos_retry_after(valor, padrao=30.0) -> float:
+    """Retry-After em segundos: aceita "120" ou data HTTP ("Wed, 21 Oct 2026 07:28:00 GMT")."""
+    if not valor:
+        return padrao
     try:
-        if not GROQ_API_KEY:
-            raise ValueError("GROQ_API_KEY não configurado")
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        quando = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return padrao
+    if quando.tzinfo is None:
+        quando = quando.replace(tzinfo=timezone.utc)
+    return max(0.0, (quando - datetime.now(timezone.utc)).total_seconds())
+
+
+class ErroQuota(Exception):
+    """Backend recusou por limite de uso (HTTP 429)."""
+
+    def __init__(self, mensagem, espera):
+        super().__init__(mensagem)
+        self.espera = espera
 
-        logger.info(f"Transcrevendo: {audio_file_path}")
 
-        with open(audio_file_path, "rb") as audio_file:
+class BackendTranscricao(ABC):
+    """
+    Interface dos backends: subclasses implementam `transcrever(caminho)`.
+    As métricas (latência e taxa de erro em EWMA, fração de quota restante)
+    ficam aqui, protegidas por um lock próprio, e são usadas pelo balanceador.
+    """
+
+    def __init__(self, nome, **_):
+        self.nome = nome
+        self.latencia = None
+        self.taxa_erro = 0.0
+        self.quota = 1.0
+        self.bloqueado_ate = 0.0
+        self.ultimo_erro = 0.0
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def transcrever(self, caminho) -> str:
+        """Texto transcrito do arquivo; ErroQuota em caso de limite de uso."""
+
+    def disponivel(self) -> bool:
+        with self._lock:
+            return time.monotonic() >= self.bloqueado_ate
+
+    def custo(self) -> float:
+        """Menor é melhor; backend nunca usado é experimentado primeiro."""
+        with self._lock:
+            if self.chamadas == 0:
+                return 0.0
+            latencia = self.latencia if self.latencia is not None else _LATENCIA_DESCONHECIDA
+            erro = self.taxa_erro * 0.5 ** ((time.monotonic() - self.ultimo_erro) / _MEIA_VIDA_ERRO)
+            return latencia * (1 + _PESO_ERRO * erro) / max(self.quota, _QUOTA_MINIMA)
+
+    def registrar(self, duracao=None, erro=False):
+        """Latência só é medida em sucessos: falhas rápidas não devem parecer backend rápido."""
+        with self._lock:
+            self.chamadas += 1
+            self.taxa_erro += _ALFA_EWMA * ((1.0 if erro else 0.0) - self.taxa_erro)
+            if erro:
+                self.ultimo_erro = time.monotonic()
+            elif duracao is not None:
+                self.latencia = duracao if self.latencia is None else \
+                    self.latencia + _ALFA_EWMA * (duracao - self.latencia)
+
+    def atualizar_quota(self, fracao):
+        with self._lock:
+            self.quota = fracao
+
+    def bloquear(self, segundos):
+        """Tira o backend da escolha por `segundos` (quota esgotada)."""
+        with self._lock:
+            self.bloqueado_ate = time.monotonic() + segundos
+            self.quota = 0.0
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {
+                "nome": self.nome,
+                "latencia": self.latencia,
+                "taxa_erro": self.taxa_erro,
+                "quota": self.quota,
+                "chamadas": self.chamadas,
+                "disponivel": time.monotonic() >= self.bloqueado_ate,
+            }
+
+
+@registrar_backend("openai")
+class BackendOpenAICompativel(BackendTranscricao):
+    """Endpoint /audio/transcriptions no formato da OpenAI (Groq, OpenAI, servidores locais)."""
+
+    def __init__(self, nome, url, api_key=None, modelo="whisper-large-v3", timeout=60, **opcoes):
+        super().__init__(nome, **opcoes)
+        self.url = url
+        self.api_key = api_key
+        self.modelo = modelo
+        self.timeout = timeout
+
+    def transcrever(self, caminho) -> str:
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        with open(caminho, "rb") as audio_file:
             files = {"file": ("audio.ogg", audio_file, "audio/ogg")}
             data = {
-                "model": "whisper-large-v3",
+                "model": self.modelo,
                 "language": "pt",
                 "prompt": PROMPT_MEDICO_PEDIATRICO,
                 "temperature": "0.0",
                 "response_format": "text"
             }
+            response = requests.post(self.url, headers=headers, files=files, data=data,
+                                     timeout=self.timeout)
+
+        self._ler_quota(response.headers)
+        if response.status_code == 429:
+            raise ErroQuota(f"HTTP 429: {response.text}", segundos_retry_after(response.headers.get("retry-after")))
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        return response.text
+
+    def _ler_quota(self, headers):
+        restantes = headers.get("x-ratelimit-remaining-requests")
+        limite = headers.get("x-ratelimit-limit-requests")
+        try:
+            if restantes is not None and limite:
+                self.atualizar_quota(int(restantes) / int(limite))
+        except ValueError:
+            pass
+
+
+@registrar_backend("local")
+class BackendLocal(BackendTranscricao):
+    """Stub sem rede para testes: devolve um texto fixo após um atraso opcional."""
+
+    def __init__(self, nome, texto="Paciente em bom estado geral, sem queixas.", atraso=0.0, **opcoes):
+        super().__init__(nome, **opcoes)
+        self.texto = texto
+        self.atraso = atraso
 
-            response = requests.post(
-                "https://api.groq.com/openai/v1/audio/transcriptions",
-                headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
-                files=files,
-                data=data,
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                texto = response.text
-                logger.info(f"Transcrição OK ({len(texto)} chars)")
-                return texto
+    def transcrever(self, caminho) -> str:
+        time.sleep(self.atraso)
+        return self.texto
+
+
+def criar_backend(config: dict) -> BackendTranscricao:
+    config = dict(config)
+    tipo = config.pop("tipo", "openai")
+    if tipo not in REGISTRO_BACKENDS:
+        raise ValueError(f"Backend de transcrição desconhecido: {tipo}")
+    return REGISTRO_BACKENDS[tipo](**config)
+
+
+class BalanceadorTranscricao:
+    """
+    Escolhe o backend de menor custo (latência EWMA × penalidade de erros ÷
+    quota restante) e, se ele falhar, tenta os seguintes na mesma chamada.
+    Seguro para uso a partir de várias threads (cada backend tem seu lock).
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def _ordenados(self):
+        disponiveis = [b for b in self.backends if b.disponivel()] or list(self.backends)
+        custos = {id(b): b.custo() for b in disponiveis}
+        return sorted(disponiveis, key=lambda b: custos[id(b)])
+
+    def transcrever(self, caminho) -> tuple:
+        """Retorna (texto, nome do backend)."""
+        if not self.backends:
+            raise ValueError("Nenhum backend de transcrição configurado (GROQ_API_KEY ou TRANSCRICAO_BACKENDS)")
+        ultimo_erro = None
+        for backend in self._ordenados():
+            inicio = time.perf_counter()
+            try:
+                texto = backend.transcrever(caminho)
+            except ErroQuota as e:
+                backend.bloquear(e.espera)
+                backend.registrar(erro=True)
+                logger.warning("⚠️ %s sem quota por %.0fs", backend.nome, e.espera)
+                ultimo_erro = e
+            except Exception as e:
+                backend.registrar(erro=True)
+                logger.warning("⚠️ Falha no backend %s: %s", backend.nome, e)
+                ultimo_erro = e
             else:
-                raise Exception(f"HTTP {response.status_code}: {response.text}")
+                backend.registrar(time.perf_counter() - inicio)
+                logger.info("Transcrição OK via %s (%d chars)", backend.nome, len(texto))
+                return texto, backend.nome
+        raise Exception(f"Todos os backends falharam: {ultimo_erro}")
+
+    def metricas(self) -> list:
+        return [b.metricas() for b in self.backends]
 
-    except Exception as e:
-        logger.error(f"Erro: {e}")
-        raise
 
 def validar_audio(audio_file_path, max_size):
     if not os.path.exists(audio_file_path):